@@ -0,0 +1,117 @@
+"""
+Compares the old dict per cell representation of the calendar with the slotted Cell representation.
+
+Usage: python -m benchmarks.cell_representation [weeks] [columns]
+"""
+import sys
+import time
+import tracemalloc
+
+from calendar_bot.calendar_bot import parse_row
+
+GRAY = {"red": 1, "green": 1, "blue": 1}
+YELLOW = {"red": 1, "green": 1, "blue": 0}
+
+
+# returns true if the cells background color rgb channels are all the same
+# false otherwise
+def get_cell_is_gray(cell):
+    effectiveFormat = cell["effectiveFormat"] if "effectiveFormat" in cell else None
+    backgroundColor = effectiveFormat["backgroundColor"] if effectiveFormat is not None and "backgroundColor" in effectiveFormat else None
+    if backgroundColor is not None:
+        # does not always seem to have all three color channels :(
+        red = backgroundColor['red'] if 'red' in backgroundColor else None
+        green = backgroundColor['green'] if 'green' in backgroundColor else None
+        blue = backgroundColor['blue'] if 'blue' in backgroundColor else None
+        if red == green and green == blue:
+            return True
+        else:
+            return False
+
+    return True
+
+# returns true if the cell is a date, false otherwise
+def get_cell_is_date(cell):
+    try:
+        if cell['effectiveFormat']['numberFormat']['type'] == 'DATE':
+            return True
+    except Exception:
+        pass # yeah this is lazy but it works
+    return False
+
+# returns true if the text of a cell is striked through, false otherwise
+def get_cell_is_strkethrough(cell):
+    try:
+        if cell['effectiveFormat']['textFormat']['strikethrough'] == True:
+            return True
+    except Exception:
+        pass # yeah this is lazy but it works
+    return False
+
+def make_row_data(weeks, num_cols, used_cols=7, signups_per_shift=10):
+    """Builds rowData the same shape as the sheets api returns, every row padded out to num_cols"""
+    row_data = []
+    for week in range(weeks):
+        date_row = [{"formattedValue": f"Monday, January {week % 28 + 1}, 2024",
+                     "effectiveFormat": {"numberFormat": {"type": "DATE"}, "backgroundColor": GRAY}} for _ in range(used_cols)]
+        row_data.append({"values": date_row + [{"effectiveFormat": {"backgroundColor": GRAY}}] * (num_cols - used_cols)})
+
+        for signup in range(signups_per_shift):
+            row = []
+            for col in range(num_cols):
+                if col < used_cols and signup < 3:
+                    row.append({"formattedValue": f"volunteer {signup}", "effectiveFormat": {"backgroundColor": GRAY}})
+                elif col < used_cols and signup == 3:
+                    row.append({"formattedValue": "new volunteer orientation", "effectiveFormat": {"backgroundColor": YELLOW}})
+                else:
+                    row.append({"effectiveFormat": {"backgroundColor": GRAY}})
+            row_data.append({"values": row})
+    return row_data
+
+def parse_rows_as_dicts(row_data):
+    """The previous representation: one dict per cell including the padding"""
+    data = []
+    for row in row_data:
+        new_row = []
+        for cell in row['values']:
+            new_row.append({
+                "is_gray": get_cell_is_gray(cell),
+                "is_date": get_cell_is_date(cell),
+                "is_strikethrough": get_cell_is_strkethrough(cell),
+                "value": cell['formattedValue'] if 'formattedValue' in cell else '',
+            })
+        data.append(new_row)
+    return data
+
+def parse_rows_as_cells(row_data):
+    return [parse_row(row) for row in row_data]
+
+def measure(parse, row_data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = parse(row_data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_cells = sum(len(row) for row in result)
+    return elapsed, peak, num_cells
+
+def main():
+    weeks = int(sys.argv[1]) if len(sys.argv) > 1 else 260
+    num_cols = int(sys.argv[2]) if len(sys.argv) > 2 else 26
+
+    row_data = make_row_data(weeks, num_cols)
+    print(f"{len(row_data)} rows x {num_cols} columns")
+
+    results = {}
+    for name, parse in (("dict per cell", parse_rows_as_dicts), ("slotted cells", parse_rows_as_cells)):
+        elapsed, peak, num_cells = measure(parse, row_data)
+        results[name] = (elapsed, peak)
+        print(f"{name:>14}: {elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:7.2f} MiB  {num_cells} cells kept")
+
+    old_elapsed, old_peak = results["dict per cell"]
+    new_elapsed, new_peak = results["slotted cells"]
+    print(f"speedup {old_elapsed / new_elapsed:.1f}x, memory {old_peak / new_peak:.1f}x smaller")
+
+if __name__ == "__main__":
+    main()
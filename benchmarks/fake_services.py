@@ -0,0 +1,213 @@
+"""
+Local stand ins for the Sheets, Drive and Slack apis so the bot can be benchmarked without touching the real ones.
+Each server runs in a background thread and counts the requests and bytes it served.
+"""
+import re
+import json
+import gzip
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# 'Title' or 'Title'!A1:G100, the two kinds of ranges the bot asks for
+RANGE_PATTERN = re.compile(r"^'((?:[^']|'')*)'(?:!([A-Z]+)(\d+):([A-Z]+)(\d+))?$")
+
+
+def column_to_index(column_label):
+    """A -> 1, Z -> 26, AA -> 27"""
+    index = 0
+    for char in column_label:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+class FakeServer:
+    """Runs a handler on a free local port. Subclasses implement handle(method, path, query, body)"""
+
+    def __init__(self):
+        self.request_counts = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+
+                name, status, payload, headers = fake_server.handle(method, url.path, parse_qs(url.query), body)
+
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data, compresslevel=5)
+                    self.send_header("Content-Encoding", "gzip")
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+                with fake_server._lock:
+                    fake_server.request_counts[name] += 1
+                    fake_server.bytes_sent += len(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts.clear()
+            self.bytes_sent = 0
+
+    def handle(self, method, path, query, body):
+        """Returns (name to count the request as, status code, json payload, extra headers)"""
+        raise NotImplementedError
+
+
+class FakeSheetsServer(FakeServer):
+    """
+    Serves spreadsheets.get (the layout and ranges), spreadsheets.batchUpdate, drive files.get (modified time) and
+    the oauth token endpoint used by service account credentials.
+    spreadsheets maps a spreadsheet id to a list of tabs (see synthetic_calendar.make_tab)
+    """
+
+    def __init__(self, spreadsheets, modified_time="2024-01-01T00:00:00.000Z"):
+        super().__init__()
+        self.spreadsheets = spreadsheets
+        self.modified_time = modified_time
+        self.batch_updates = []
+
+    def handle(self, method, path, query, body):
+        if path == "/token":
+            return "token", 200, {"access_token": "benchmark", "expires_in": 3600, "token_type": "Bearer"}, {}
+
+        match = re.match(r"^/drive/v3/files/([^/]+)$", path)
+        if match:
+            if match.group(1) not in self.spreadsheets:
+                return "drive.files.get", 404, {"error": {"code": 404}}, {}
+            return "drive.files.get", 200, {"modifiedTime": self.modified_time}, {}
+
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(:batchUpdate)?$", path)
+        if match is None or match.group(1) not in self.spreadsheets:
+            return "not_found", 404, {"error": {"code": 404, "message": f"{path} not found"}}, {}
+
+        tabs = self.spreadsheets[match.group(1)]
+
+        if match.group(2):
+            request = json.loads(body)
+            self.batch_updates.append((match.group(1), request))
+            return "spreadsheets.batchUpdate", 200, {"spreadsheetId": match.group(1), "replies": [{} for _ in request["requests"]]}, {}
+
+        if "ranges" in query:
+            return "spreadsheets.get ranges", 200, self.get_ranges(tabs, query["ranges"]), {}
+
+        if query.get("includeGridData") == ["true"]:
+            return "spreadsheets.get layout", 200, {"sheets": [
+                {"properties": tab["properties"], "data": [{"rowMetadata": [{"hiddenByUser": True} if hidden else {} for hidden in tab["hidden_rows"]]}]}
+                for tab in tabs
+            ]}, {}
+
+        return "spreadsheets.get", 200, {"sheets": [{"properties": tab["properties"]} for tab in tabs]}, {}
+
+    def get_ranges(self, tabs, ranges):
+        """Like the api, returns each tab once with one grid data entry per range of that tab in the order asked for"""
+        tabs_by_title = {tab["properties"]["title"]: tab for tab in tabs}
+        data_by_title = {}
+
+        for sheet_range in ranges:
+            match = RANGE_PATTERN.match(sheet_range)
+            title = match.group(1).replace("''", "'")
+            tab = tabs_by_title[title]
+
+            if match.group(2):
+                start_row, end_row = int(match.group(3)) - 1, int(match.group(5))
+                end_col = column_to_index(match.group(4))
+            else:
+                start_row, end_row = 0, len(tab["rows"])
+                end_col = None
+
+            rows = [{"values": row.get("values", [])[:end_col]} if row.get("values") else {} for row in tab["rows"][start_row:end_row]]
+            # the api leaves off empty rows at the end of a range
+            while rows and not rows[-1].get("values"):
+                rows.pop()
+
+            grid_data = {"rowData": rows}
+            if start_row:
+                grid_data["startRow"] = start_row
+            data_by_title.setdefault(title, []).append(grid_data)
+
+        return {"sheets": [{"properties": {"title": title}, "data": data} for title, data in data_by_title.items()]}
+
+
+class FakeSlackServer(FakeServer):
+    """Serves chat.postMessage and chat.update, and accepts interaction responses posted to response_url"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self._next_ts = 0
+        # how many of the next messages are rejected (like a channel that does not exist)
+        self.reject_messages = 0
+
+    @property
+    def api_url(self):
+        return f"{self.url}api/"
+
+    def get_response_url(self, name="poll"):
+        return f"{self.url}response/{name}"
+
+    def handle(self, method, path, query, body):
+        if path.startswith("/response/"):
+            self.messages.append(("response_url", json.loads(body)))
+            return "response_url", 200, {"ok": True}, {}
+
+        method_name = path.rsplit("/", 1)[-1]
+        if method_name not in ("chat.postMessage", "chat.update"):
+            return method_name, 200, {"ok": False, "error": "unknown_method"}, {}
+
+        # slack_sdk sends json when there are blocks and form data otherwise
+        try:
+            message = json.loads(body)
+        except ValueError:
+            message = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+        with self._lock:
+            if self.reject_messages:
+                self.reject_messages -= 1
+                return method_name, 200, {"ok": False, "error": "channel_not_found"}, {}
+            self._next_ts += 1
+            ts = message.get("ts") or f"{1700000000 + self._next_ts}.000100"
+
+        self.messages.append((method_name, message))
+        return method_name, 200, {"ok": True, "channel": message.get("channel"), "ts": ts}, {}
@@ -0,0 +1,68 @@
+"""
+Measures how long importing each trigger's modules takes in a fresh interpreter, which is most of what a
+cold start pays before the function runs. Uses python -X importtime and takes the best of a few runs.
+
+Usage: python -m benchmarks.import_time [module ...]
+"""
+import os
+import re
+import subprocess
+import sys
+
+# what each trigger imports, function_app on its own is what every cold start pays
+DEFAULT_MODULES = ["function_app", "calendar_bot.calendar_bot", "calendar_bot.hide_rows", "calendar_bot.slack_poll"]
+
+RUNS = 5
+
+# how many of the slowest packages to list under each module
+TOP_PACKAGES = 8
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module):
+    """
+    Imports the module in a new interpreter, returns the milliseconds it took (not counting interpreter startup)
+    and a list of (cumulative milliseconds, package) for every top level package it loaded along the way
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+
+        cumulative = int(match.group(2)) / 1000
+        name = match.group(4)
+        is_top_level = len(match.group(3)) == 1
+
+        # imports are listed after everything they imported, so the module comes after all of its packages
+        if is_top_level and name == module:
+            return cumulative, packages
+        if is_top_level:
+            # something imported by interpreter startup (like site), not by the module
+            packages = []
+        elif "." not in name:
+            packages.append((cumulative, name))
+
+    raise Exception(f"No import time found for {module}")
+
+def main():
+    modules = sys.argv[1:] or DEFAULT_MODULES
+
+    for module in modules:
+        runs = [measure_import(module) for _ in range(RUNS)]
+        total, packages = min(runs, key=lambda run: run[0])
+
+        print(f"{module}: {total:.1f}ms (best of {RUNS})")
+        for cumulative, name in sorted(packages, reverse=True)[:TOP_PACKAGES]:
+            print(f"    {cumulative:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
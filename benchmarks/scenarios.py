@@ -0,0 +1,229 @@
+"""
+Runs the bot against local fake Sheets, Drive and Slack servers with a synthetic calendar and reports the wall time,
+peak memory and requests made for each scenario. Each scenario runs in a fresh interpreter (like a cold start) so
+the peak memory is only that scenario's.
+
+Usage: python -m benchmarks.scenarios [--weeks 520] [--columns 7] [--signups 10] [--json] [scenario ...]
+Scenarios: full_run, hide_rows, config_parse, poll_update (all of them by default)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import date, timedelta
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak memory is not reported there
+    resource = None
+
+from benchmarks.fake_services import FakeSheetsServer, FakeSlackServer
+from benchmarks.synthetic_calendar import make_calendar, make_config_rows, make_tab
+
+CALENDAR_SHEET_ID = "benchmark-calendar"
+CONFIG_SHEET_ID = "benchmark-config"
+CALENDAR_START = date(2024, 1, 1)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_today(weeks):
+    """A Tuesday in the middle of the calendar so every message type has shifts to look at"""
+    return CALENDAR_START + timedelta(weeks=weeks // 2, days=1)
+
+def make_service_account(token_uri):
+    """Service account credentials with a throwaway key that get their tokens from the fake server"""
+    import rsa
+    _, private_key = rsa.newkeys(1024)
+    return {
+        "type": "service_account",
+        "project_id": "benchmark",
+        "private_key_id": "benchmark",
+        "private_key": private_key.save_pkcs1().decode("utf-8"),
+        "client_email": "benchmark@benchmark.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": token_uri,
+    }
+
+
+#
+# scenarios, run in the child process. Each does its setup and returns the function to time
+#
+
+def full_run(args):
+    from calendar_bot.calendar_bot import send_slack_messages
+    today = date.fromisoformat(args.today)
+    return lambda: send_slack_messages(today=today)
+
+def hide_rows(args):
+    from calendar_bot.hide_rows import hide_rows
+    today = date.fromisoformat(args.today)
+    return lambda: hide_rows(today=today)
+
+def config_parse(args):
+    from calendar_bot.config import get_config
+    return get_config
+
+def poll_update(args):
+    from calendar_bot.poll_store import Poll
+    from calendar_bot.slack_poll import get_question_section, render_poll, update_poll
+    from calendar_bot.update_coalescer import get_update_coalescer
+
+    num_options = 5
+    poll = Poll("1700000000.000100", [get_question_section("Who is coming to the work party?", False)], [f"Option {option_index}" for option_index in range(num_options)])
+
+    # a poll that already has a lot of votes, the first click reads them back out of the blocks
+    for voter in range(args.voters):
+        poll.toggle_vote(f"U{voter:08d}", voter % num_options)
+    message = {"ts": poll.ts, "blocks": render_poll(poll)}
+
+    def click_buttons():
+        for click in range(args.clicks):
+            update_poll({
+                "user": {"id": f"U{click % args.voters:08d}"},
+                "message": message,
+                "actions": [{"value": str(click % num_options)}],
+                "response_url": args.response_url,
+            })
+        # the message updates are sent in the background, wait for them
+        get_update_coalescer().flush()
+
+    return click_buttons
+
+SCENARIOS = {
+    "full_run": full_run,
+    "hide_rows": hide_rows,
+    "config_parse": config_parse,
+    "poll_update": poll_update,
+}
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_child(args):
+    run = SCENARIOS[args.child](args)
+
+    start = time.perf_counter()
+    run()
+    wall_time = time.perf_counter() - start
+
+    print(json.dumps({"wall_time": wall_time, "peak_rss_mb": get_peak_rss_mb()}))
+
+
+#
+# the parent process, runs the fake servers and each scenario in a child process
+#
+
+def run_scenario(name, args, sheets_server: FakeSheetsServer, slack_server: FakeSlackServer, service_account, temp_dir):
+    sheets_server.reset_counts()
+    slack_server.reset_counts()
+
+    env = dict(os.environ)
+    env.pop("calendar_bot_tenants", None)
+    env.update({
+        "SHEET_ID": CALENDAR_SHEET_ID,
+        "CONFIG_SHEET_ID": CONFIG_SHEET_ID,
+        "CONFIG_SHEET_GID": "0",
+        "google_api_key": "benchmark",
+        "slack_token": "xoxb-benchmark",
+        "google_service_account": json.dumps(service_account),
+        "sheets_api_root": sheets_server.url,
+        "drive_api_root": sheets_server.url,
+        "slack_api_url": slack_server.api_url,
+        # nothing cached from a previous scenario
+        "config_cache_path": os.path.join(temp_dir, f"{name}_config_cache.json"),
+        "snapshot_store_path": os.path.join(temp_dir, f"{name}_snapshot.sqlite3"),
+        "poll_store_path": os.path.join(temp_dir, f"{name}_polls.sqlite3"),
+        "message_ledger_path": os.path.join(temp_dir, f"{name}_messages.sqlite3"),
+    })
+
+    command = [
+        sys.executable, "-m", "benchmarks.scenarios", "--child", name,
+        "--today", get_today(args.weeks).isoformat(),
+        "--voters", str(args.voters), "--clicks", str(args.clicks),
+        "--response-url", slack_server.get_response_url(),
+    ]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Scenario {name} failed:\n{result.stderr[-3000:]}")
+
+    measurements = json.loads(result.stdout.strip().splitlines()[-1])
+    measurements.update({
+        "scenario": name,
+        "sheets_requests": dict(sheets_server.request_counts),
+        "slack_requests": dict(slack_server.request_counts),
+        "bytes_downloaded": sheets_server.bytes_sent,
+    })
+    return measurements
+
+def print_measurements(measurements):
+    peak_rss = f"{measurements['peak_rss_mb']:.1f}MB" if measurements['peak_rss_mb'] is not None else "n/a"
+    print(f"{measurements['scenario']}: {measurements['wall_time']:.3f}s, peak rss {peak_rss}, "
+          f"{measurements['bytes_downloaded'] / 1024:.1f}KB downloaded")
+
+    for server in ("sheets_requests", "slack_requests"):
+        requests = measurements[server]
+        if requests:
+            counts = ", ".join(f"{name} {count}" for name, count in sorted(requests.items()))
+            print(f"    {server.replace('_', ' ')}: {sum(requests.values())} ({counts})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the bot against fake Sheets and Slack servers")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default all)")
+    parser.add_argument("--weeks", type=int, default=520, help="weeks in the calendar")
+    parser.add_argument("--columns", type=int, default=7, help="columns in the calendar, past 7 are blank padding")
+    parser.add_argument("--signups", type=int, default=10, help="signup rows under each date")
+    parser.add_argument("--voters", type=int, default=200, help="votes already on the poll")
+    parser.add_argument("--clicks", type=int, default=50, help="poll button clicks to handle")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    # used by the parent to run a single scenario in a child process
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--today", help=argparse.SUPPRESS)
+    parser.add_argument("--response-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+
+    rows, hidden_rows = make_calendar(args.weeks, args.columns, args.signups, start=CALENDAR_START, hidden_weeks=args.weeks // 2 - 1)
+    config_rows = make_config_rows()
+
+    sheets_server = FakeSheetsServer({
+        CALENDAR_SHEET_ID: [make_tab("Calendar", rows, hidden_rows, columns=args.columns)],
+        CONFIG_SHEET_ID: [make_tab("Config", config_rows, frozen_rows=0)],
+    }).start()
+    slack_server = FakeSlackServer().start()
+    service_account = make_service_account(f"{sheets_server.url}token")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in names:
+                measurements = run_scenario(name, args, sheets_server, slack_server, service_account, temp_dir)
+                results.append(measurements)
+                if not args.json:
+                    print_measurements(measurements)
+    finally:
+        sheets_server.stop()
+        slack_server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
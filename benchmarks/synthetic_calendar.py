@@ -0,0 +1,126 @@
+"""
+Builds calendar and config sheets the same shape as the sheets api returns them, for the benchmarks.
+"""
+import random
+from datetime import date, timedelta
+
+from calendar_bot.config import DAYS_OF_WEEK
+from calendar_bot.dates import SERIAL_EPOCH
+
+GRAY = {"red": 1, "green": 1, "blue": 1}
+YELLOW = {"red": 1, "green": 1, "blue": 0}
+
+DATE_PATTERN = "dddd, mmmm d, yyyy"
+
+
+def make_cell(value="", background=GRAY, is_date=False, is_strikethrough=False):
+    effective_format = {"backgroundColor": background}
+    cell = {"effectiveFormat": effective_format}
+
+    if is_date:
+        effective_format["numberFormat"] = {"type": "DATE", "pattern": DATE_PATTERN}
+        cell["effectiveValue"] = {"numberValue": (value - SERIAL_EPOCH).days}
+        cell["formattedValue"] = f"{value:%A}, {value:%B} {value.day}, {value.year}"
+    elif value != "":
+        cell["formattedValue"] = value
+
+    if is_strikethrough:
+        effective_format["textFormat"] = {"strikethrough": True}
+
+    return cell
+
+def make_calendar(weeks, columns=7, signups_per_shift=10, start=date(2024, 1, 1), hidden_weeks=0, seed=0):
+    """
+    Returns the rows (rowData) of a calendar with a row of dates for every week followed by signups_per_shift rows
+    of signups. The first seven columns are the days of the week, any columns after that are blank like the padding
+    at the edge of a real sheet. Also returns which rows are hidden, the header and the first hidden_weeks weeks
+    """
+    rand = random.Random(seed)
+    rows = [{"values": [make_cell("Volunteer Calendar")]}]
+    hidden_rows = [False]
+
+    for week in range(weeks):
+        week_start = start + timedelta(weeks=week)
+        is_hidden = week < hidden_weeks
+
+        date_row = []
+        for col in range(columns):
+            if col < len(DAYS_OF_WEEK):
+                date_row.append(make_cell(week_start + timedelta(days=col), is_date=True))
+            else:
+                date_row.append(make_cell())
+        rows.append({"values": date_row})
+        hidden_rows.append(is_hidden)
+
+        for signup in range(signups_per_shift):
+            signup_row = []
+            for col in range(columns):
+                if col >= len(DAYS_OF_WEEK):
+                    signup_row.append(make_cell())
+                elif signup == 0 and DAYS_OF_WEEK[col] == "Tuesday":
+                    signup_row.append(make_cell("Bike skool night", background=YELLOW))
+                elif signup == 1 and rand.random() < 0.1:
+                    signup_row.append(make_cell("New volunteer orientation", background=YELLOW))
+                elif rand.random() < 0.6:
+                    name = f"volunteer {rand.randrange(500)}"
+                    if rand.random() < 0.15:
+                        name += " 🔑"
+                    signup_row.append(make_cell(name, is_strikethrough=rand.random() < 0.05))
+                else:
+                    signup_row.append(make_cell())
+            rows.append({"values": signup_row})
+            hidden_rows.append(is_hidden)
+
+    return rows, hidden_rows
+
+def make_config_rows(shift_days=("Monday", "Thursday", "Saturday")):
+    """
+    Returns the rows (rowData) of a config sheet with a shift block for each of the shift days (warnings 6, 3 and 0
+    days before, notes on the day) and a bike school reminder block for Tuesdays, like config.json.
+    Each shift day posts to its own channel so the slack rate limit (per channel) does not dominate the benchmarks
+    """
+    rows = []
+
+    def add_row(values):
+        rows.append({"values": [{"formattedValue": value} if value != "" else {} for value in values]})
+
+    for shift_day in shift_days:
+        shift_day_index = DAYS_OF_WEEK.index(shift_day)
+        send_days = [DAYS_OF_WEEK[(shift_day_index - days_before) % 7] for days_before in (6, 3, 0)]
+        channel = f"#{shift_day.lower()}-shifts"
+
+        add_row([f"Shift: {shift_day}"])
+        add_row(["Send on"] + DAYS_OF_WEEK)
+        add_row(["Warning"] + ["TRUE" if day in send_days else "FALSE" for day in DAYS_OF_WEEK])
+        add_row(["Notify channel"] + ["FALSE"] * 7)
+        add_row(["Channel"] + [channel] * 7)
+        add_row(["Volunteer threshold"] + ["8"] * 7)
+        add_row([""])
+        add_row(["Notes"] + ["TRUE" if day == shift_day else "FALSE" for day in DAYS_OF_WEEK])
+        add_row(["Notes channel"] + [channel] * 7)
+        add_row([""])
+
+    add_row(["Bike School Reminder: Tuesday"])
+    add_row(["Send on"] + DAYS_OF_WEEK)
+    add_row(["Reminder"] + ["TRUE" if day == "Tuesday" else "FALSE" for day in DAYS_OF_WEEK])
+    add_row(["Notify channel"] + ["FALSE"] * 7)
+    add_row(["Channel"] + ["#bike-school"] * 7)
+
+    return rows
+
+def make_tab(title, rows, hidden_rows=None, sheet_id=0, index=0, columns=None, frozen_rows=1):
+    """Bundles the rows of a tab with its properties the way the fake sheets server expects them"""
+    return {
+        "properties": {
+            "index": index,
+            "sheetId": sheet_id,
+            "title": title,
+            "gridProperties": {
+                "rowCount": len(rows),
+                "columnCount": columns if columns is not None else max((len(row.get("values", [])) for row in rows), default=1),
+                "frozenRowCount": frozen_rows,
+            },
+        },
+        "rows": rows,
+        "hidden_rows": hidden_rows if hidden_rows is not None else [False] * len(rows),
+    }
@@ -0,0 +1,107 @@
+"""
+Checks change alerts end to end against the fake Sheets and Slack servers with the synthetic calendar:
+- a shift that only moved into the days warnings look ahead to since the daily run still gets an alert for its first drop
+- an alert slack rejects keeps the change pending and is sent on the next check
+
+Usage: python -m benchmarks.verify_change_alerts
+"""
+import os
+import json
+import tempfile
+from datetime import timedelta
+
+from benchmarks.fake_services import FakeSheetsServer, FakeSlackServer
+from benchmarks.scenarios import CALENDAR_SHEET_ID, CONFIG_SHEET_ID, CALENDAR_START
+from benchmarks.synthetic_calendar import SERIAL_EPOCH, make_calendar, make_cell, make_config_rows, make_tab
+
+WEEKS = 20
+# the config posts warnings 6, 3 and 0 days before monday, thursday and saturday shifts, a monday is checked the
+# tuesday before it for the first time
+TODAY = CALENDAR_START + timedelta(weeks=10)
+SHIFT_DATE = TODAY + timedelta(days=7)
+
+
+def set_volunteers(rows, shift_date, names):
+    """Replaces the signups under the date with the given names"""
+    col = shift_date.weekday()
+    for row_index, row in enumerate(rows):
+        values = row.get("values", [])
+        if len(values) > col and values[col].get("effectiveValue", {}).get("numberValue") == (shift_date - SERIAL_EPOCH).days:
+            break
+    else:
+        raise Exception(f"{shift_date} is not in the calendar")
+
+    for offset, row in enumerate(rows[row_index + 1:row_index + 11]):
+        row["values"][col] = make_cell(names[offset]) if offset < len(names) else make_cell()
+
+def main():
+    rows, hidden_rows = make_calendar(WEEKS, start=CALENDAR_START, hidden_weeks=9)
+    # two volunteers are enough, so a shift with a keyholder and a friend is covered
+    config_rows = json.loads(json.dumps(make_config_rows()).replace('"8"', '"2"'))
+
+    sheets_server = FakeSheetsServer({
+        CALENDAR_SHEET_ID: [make_tab("Calendar", rows, hidden_rows)],
+        CONFIG_SHEET_ID: [make_tab("Config", config_rows, frozen_rows=0)],
+    }).start()
+    slack_server = FakeSlackServer().start()
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ.pop("calendar_bot_tenants", None)
+            os.environ.update({
+                "SHEET_ID": CALENDAR_SHEET_ID,
+                "CONFIG_SHEET_ID": CONFIG_SHEET_ID,
+                "CONFIG_SHEET_GID": "0",
+                "google_api_key": "benchmark",
+                "slack_token": "xoxb-benchmark",
+                "sheets_api_root": sheets_server.url,
+                "drive_api_root": sheets_server.url,
+                "slack_api_url": slack_server.api_url,
+                "config_cache_path": os.path.join(temp_dir, "config_cache.json"),
+                "snapshot_store_path": os.path.join(temp_dir, "snapshot.sqlite3"),
+                "message_ledger_path": os.path.join(temp_dir, "messages.sqlite3"),
+            })
+
+            # imported once the settings are in place
+            from calendar_bot import change_alerts
+            from calendar_bot.calendar_bot import send_slack_messages
+            from calendar_bot.snapshot_store import get_snapshot_store
+
+            # checked as soon as it changed instead of waiting for the sheet to settle
+            change_alerts.CHANGE_QUIET_SECONDS = 0
+
+            def get_alerts_after_change(names, today):
+                set_volunteers(rows, SHIFT_DATE, names)
+                get_snapshot_store().add_pending_change(CALENDAR_SHEET_ID)
+                num_messages = len(slack_server.messages)
+                try:
+                    change_alerts.check_pending_changes(today)
+                except Exception as e:
+                    print(f"Check failed: {e}")
+                return [message['text'] for _, message in slack_server.messages[num_messages:] if SHIFT_DATE.isoformat() in message['text']]
+
+            set_volunteers(rows, SHIFT_DATE, ["keyholder 🔑", "friend"])
+            send_slack_messages(today=TODAY)
+
+            # the day after the daily run the shift is a week away, inside the 6 days before window for the first time
+            alerts = get_alerts_after_change(["friend"], TODAY + timedelta(days=1))
+            assert len(alerts) == 1, f"Expected an alert for the first drop, got {alerts}"
+
+            # slack rejects the alert, the change stays pending and the next check sends it
+            get_alerts_after_change(["keyholder 🔑", "friend"], TODAY + timedelta(days=1))
+            slack_server.reject_messages = 1
+            alerts = get_alerts_after_change(["friend"], TODAY + timedelta(days=1))
+            assert not alerts, f"Expected the alert to be rejected, got {alerts}"
+            num_messages = len(slack_server.messages)
+            change_alerts.check_pending_changes(TODAY + timedelta(days=1))
+            alerts = [message['text'] for _, message in slack_server.messages[num_messages:]]
+            assert len(alerts) == 1, f"Expected the rejected alert to be sent again, got {alerts}"
+    finally:
+        sheets_server.stop()
+        slack_server.stop()
+
+    print("Change alerts are sent for new shifts in the window and after slack rejects them")
+
+
+if __name__ == "__main__":
+    main()
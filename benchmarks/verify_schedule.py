@@ -0,0 +1,59 @@
+"""
+Checks that MessageSchedule has the same messages due each day as checking every message config each day (how
+the daily run used to decide), with the config of the synthetic config sheet and with random configs.
+
+Usage: python -m benchmarks.verify_schedule [days]
+"""
+import sys
+import random
+from datetime import date, timedelta
+
+from calendar_bot.config import DAYS_OF_WEEK, Config, MessageConfig, parse_config, parse_config_row
+from calendar_bot.message_schedule import MESSAGE_TYPES, MessageSchedule
+from benchmarks.synthetic_calendar import make_config_rows
+
+
+def get_reference_due(config: Config, today: date):
+    """The previous daily check, every config of every type looks at the shift days_before days from today"""
+    due = []
+    for message_type in MESSAGE_TYPES:
+        for message_config in getattr(config, message_type):
+            shift_date = today + timedelta(days=message_config.days_before)
+            if DAYS_OF_WEEK[shift_date.weekday()] in message_config.days:
+                due.append((message_type, id(message_config), shift_date))
+    return due
+
+def make_random_config(rnd: random.Random):
+    def make_message_configs():
+        # days can repeat or not be a day at all, like a typo in config.json
+        return [MessageConfig(rnd.sample(DAYS_OF_WEEK + ["Funday", "Monday"], rnd.randint(0, 4)), rnd.randint(0, 13), False) for _ in range(rnd.randint(0, 4))]
+
+    return Config(make_message_configs(), make_message_configs(), make_message_configs())
+
+def check_config(config: Config, start_date: date, days):
+    end_date = start_date + timedelta(days=days - 1)
+    schedule = MessageSchedule(config, start_date, end_date)
+
+    for day in range(days):
+        today = start_date + timedelta(days=day)
+        expected = get_reference_due(config, today)
+        actual = [(message.message_type, id(message.config), message.shift_date) for message in schedule.get_due(today)]
+        if actual != expected:
+            raise AssertionError(f"On {today} the schedule has {actual} due, expected {expected}")
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    rnd = random.Random(0)
+
+    config = parse_config([parse_config_row(row) for row in make_config_rows()])
+    for start_offset in range(7):
+        check_config(config, date(2024, 1, 1) + timedelta(days=start_offset), days)
+
+    for _ in range(200):
+        check_config(make_random_config(rnd), date(2024, 1, 1) + timedelta(days=rnd.randint(0, 365)), days // 4)
+
+    print(f"Due messages match over {days} days for the synthetic config and 200 random configs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Checks that the shifts extracted with the per-column bitsets of CalendarGrid are the same as walking down every
+cell under each date (how extract_shift used to work) on randomized calendars, and on the synthetic calendar the
+benchmarks use.
+
+Usage: python -m benchmarks.verify_shifts [grids]
+"""
+import sys
+import random
+from datetime import date, timedelta
+
+from calendar_bot.calendar_bot import parse_row, convert_dates
+from calendar_bot.calendar_grid import CalendarGrid, Cell, EMPTY_CELL
+from calendar_bot.shifts import Shift, ShiftTable
+from benchmarks.synthetic_calendar import make_calendar
+
+
+def reference_extract_shift(calendar: CalendarGrid, shift_date, row, col):
+    """The previous extract_shift, goes down the column one cell at a time until the next date"""
+    row = row + 1
+
+    all_volunteers = []
+    special_rows = []
+
+    while row < calendar.num_rows and type(calendar.get_cell(row, col).value) is str:
+        cell = calendar.get_cell(row, col)
+
+        if not cell.is_gray:
+            special_rows.append(cell.value)
+        elif not cell.is_strikethrough:
+            all_volunteers.extend(item.strip() for item in cell.value.split(","))
+
+        row = row + 1
+
+    all_volunteers = [volunteer for volunteer in all_volunteers if volunteer.strip() not in (None, '')]
+    special_rows = [special_row for special_row in special_rows if special_row.strip() not in (None, '')]
+
+    return Shift(shift_date, all_volunteers, special_rows)
+
+def make_random_cell(rnd: random.Random, next_date):
+    kind = rnd.random()
+    if kind < 0.1:
+        return Cell(next_date(), is_date=True)
+    if kind < 0.3:
+        return EMPTY_CELL
+    if kind < 0.4:
+        return Cell("  ")
+    value = rnd.choice(["alex", "sam 🔑", "kim, lee", " jo ,", "bike school", "new volunteer orientation", ","])
+    return Cell(value, is_gray=rnd.random() < 0.7, is_strikethrough=rnd.random() < 0.2)
+
+def make_random_grid(rnd: random.Random):
+    """Ragged rows of random cells, with dates scattered anywhere (some repeated) like a messy calendar"""
+    first_date = date(2024, 1, 1)
+    dates = [first_date]
+
+    def next_date():
+        # now and then a date that is already in the sheet, only its first location counts
+        if rnd.random() < 0.1:
+            return rnd.choice(dates)
+        dates.append(dates[-1] + timedelta(days=1))
+        return dates[-1]
+
+    return [[make_random_cell(rnd, next_date) for _ in range(rnd.randint(0, 9))] for _ in range(rnd.randint(0, 60))]
+
+def check_grid(cells):
+    calendar = CalendarGrid(cells)
+    shifts = ShiftTable(calendar)
+
+    for shift_date in calendar.get_dates():
+        row, col = calendar.get_date_location(shift_date)
+        expected = reference_extract_shift(calendar, shift_date, row, col)
+        actual = shifts.get_shift(shift_date)
+        if actual != expected:
+            raise AssertionError(f"Shift on {shift_date} at row {row} col {col} is {actual}, expected {expected}")
+
+def main():
+    grids = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rnd = random.Random(0)
+
+    for _ in range(grids):
+        check_grid(make_random_grid(rnd))
+
+    rows, _ = make_calendar(104)
+    cells = [parse_row(row) for row in rows]
+    convert_dates(cells)
+    check_grid(cells)
+
+    print(f"Shifts match on {grids} random grids and the synthetic calendar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Checks that simulate() produces the same messages as running the bot once for every day of the range, against the
+fake Sheets and Slack servers with the synthetic calendar. The relative day in each message ("this Thursday") is left
+out of the comparison, the daily runs word it relative to the actual today.
+
+Usage: python -m benchmarks.verify_simulator [days]
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from benchmarks.fake_services import FakeSheetsServer, FakeSlackServer
+from benchmarks.scenarios import CALENDAR_SHEET_ID, CONFIG_SHEET_ID, CALENDAR_START
+from benchmarks.synthetic_calendar import make_calendar, make_config_rows, make_tab
+
+WEEKS = 60
+
+
+def normalize(message):
+    return re.sub(r"For the shift .*?\(|Bike Skool is .*?\(", "", message)
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+
+    rows, hidden_rows = make_calendar(WEEKS, start=CALENDAR_START, hidden_weeks=9)
+    sheets_server = FakeSheetsServer({
+        CALENDAR_SHEET_ID: [make_tab("Calendar", rows, hidden_rows)],
+        CONFIG_SHEET_ID: [make_tab("Config", make_config_rows(), frozen_rows=0)],
+    }).start()
+    slack_server = FakeSlackServer().start()
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ.pop("calendar_bot_tenants", None)
+            os.environ.update({
+                "SHEET_ID": CALENDAR_SHEET_ID,
+                "CONFIG_SHEET_ID": CONFIG_SHEET_ID,
+                "CONFIG_SHEET_GID": "0",
+                "google_api_key": "benchmark",
+                "slack_token": "xoxb-benchmark",
+                "sheets_api_root": sheets_server.url,
+                "drive_api_root": sheets_server.url,
+                "slack_api_url": slack_server.api_url,
+                "config_cache_path": os.path.join(temp_dir, "config_cache.json"),
+                "snapshot_store_path": os.path.join(temp_dir, "snapshot.sqlite3"),
+                # every daily run has to send its messages, not skip ones the ledger has seen
+                "message_ledger_mode": "off",
+            })
+
+            # imported once the settings are in place
+            from calendar_bot.calendar_bot import send_slack_messages
+            from calendar_bot.simulator import simulate
+
+            start_date = CALENDAR_START + timedelta(weeks=10)
+            end_date = start_date + timedelta(days=days - 1)
+
+            start = time.perf_counter()
+            simulated = [(message.channel, normalize(message.message)) for message in simulate(start_date, end_date).get_sorted_messages()]
+            simulate_time = time.perf_counter() - start
+
+            sent = []
+            start = time.perf_counter()
+            for day in range(days):
+                num_sent = len(slack_server.messages)
+                send_slack_messages(today=start_date + timedelta(days=day))
+                sent += [(message['channel'], normalize(message['text'])) for _, message in slack_server.messages[num_sent:]]
+            daily_time = time.perf_counter() - start
+    finally:
+        sheets_server.stop()
+        slack_server.stop()
+
+    missing = Counter(sent) - Counter(simulated)
+    extra = Counter(simulated) - Counter(sent)
+    if missing or extra:
+        raise AssertionError(f"The simulation is missing {list(missing)[:3]} and has extra {list(extra)[:3]}")
+
+    print(f"The same {len(sent)} messages over {days} days, simulated in {simulate_time:.2f}s and {daily_time:.2f}s for the daily runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,253 +1,363 @@
 import os
-import requests
-from dateutil.parser import parse
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from typing import Callable
-
-from calendar_bot.slack import send_volunteer_warning_message, send_special_note_message, send_bike_school_message, send_message
+from typing import List
+
+from calendar_bot.slack import send_volunteer_warning_message, send_special_note_message, send_bike_school_message
+from calendar_bot.slack_client import send_message, flush_messages
+from calendar_bot.calendar_grid import CalendarGrid, Cell, EMPTY_CELL, trim_blank_cells
+from calendar_bot.shifts import Shift, ShiftTable
+from calendar_bot.message_schedule import MessageSchedule, get_should_send
+from calendar_bot.fetch_planner import FetchPlanner, SheetLayout
+from calendar_bot.snapshot_store import CHANGE_ALERTS_BASELINE, ShiftChange, SnapshotStore, get_snapshot_store
+from calendar_bot.message_ledger import LEDGER_RETENTION_DAYS, get_ledger_mode, get_message_ledger
+from calendar_bot.dates import parse_cell_date, parse_date_string
+from calendar_bot.tenants import Tenant, TenantErrors, get_tenants
+from calendar_bot.tracing import span, trace_run, wrap
 from calendar_bot.config import * # yeah this is kinda awful but I don't feel like improving it with a real config file
 
-## shamelessly stolen from gspread
-def rowcol_to_a1(row: int, col: int) -> str:
-    """Translates a row and column cell address to A1 notation.
+def get_cell_format(cell):
+    """
+    Classifies a cell from the sheets api in one pass, returns (is_gray, is_date, is_strikethrough).
+    Same as the previous get_cell_is_gray, get_cell_is_date and get_cell_is_strkethrough (kept in
+    benchmarks/cell_representation.py) but without looking up effectiveFormat three times or raising and catching an exception for every cell missing a field
+    """
+    effective_format = cell.get('effectiveFormat')
+    if effective_format is None:
+        return True, False, False
 
-    :param row: The row of the cell to be converted.
-        Rows start at index 1.
-    :type row: int, str
+    background_color = effective_format.get('backgroundColor')
+    # does not always have all three color channels, a missing one is treated as different from one that is set
+    is_gray = background_color is None or background_color.get('red') == background_color.get('green') == background_color.get('blue')
 
-    :param col: The column of the cell to be converted.
-        Columns start at index 1.
-    :type row: int, str
+    number_format = effective_format.get('numberFormat')
+    is_date = number_format is not None and number_format.get('type') == 'DATE'
 
-    :returns: a string containing the cell's coordinates in A1 notation.
+    text_format = effective_format.get('textFormat')
+    is_strikethrough = text_format is not None and text_format.get('strikethrough') == True
 
-    Example:
+    return is_gray, is_date, is_strikethrough
 
-    >>> rowcol_to_a1(1, 1)
-    A1
+# how many rows are downloaded at first when only downloading the rows around the dates that are needed,
+# the window doubles in size each time it does not contain all the dates
+INITIAL_WINDOW_SIZE = 100
 
+def get_sheet_data(api_key, sheet_id, first_date=None, last_date=None, planner: FetchPlanner = None):
     """
+    Returns the cells of the calendar as a 2D array. If first_date and last_date are given, only the rows around
+    those dates are downloaded and every other row is left empty (see get_rows_around_dates), otherwise the
+    entire sheet is downloaded. Pass in the runs planner to share its requests with the other consumers
+    """
+    planner = planner if planner is not None else FetchPlanner(sheet_id, api_key)
+    layout = planner.get_default_sheet_layout()
 
-    div = col
-    column_label = ""
+    if first_date is None or last_date is None:
+        return planner.get(layout, layout.get_range(), parse_row)
 
-    while div:
-        (div, mod) = divmod(div, 26)
-        if mod == 0:
-            mod = 26
-            div -= 1
-        column_label = chr(mod + 64) + column_label
+    def get_rows(start_row, end_row):
+        return [parse_row_with_dates(row) for row in get_row_data(planner, layout, start_row, end_row)]
 
-    label = "{}{}".format(column_label, row)
+    anchor_row = get_window_anchor_row(layout)
+    return get_rows_around_dates(get_rows, layout.grid_properties['rowCount'], anchor_row, first_date, last_date)
 
-    return label
+def get_first_visible_row(hidden_rows, frozen_row_count):
+    """Returns the index of the first row that is not hidden and not frozen (pinned)"""
+    for row_index in range(frozen_row_count, len(hidden_rows)):
+        if not hidden_rows[row_index]:
+            return row_index
 
-# returns sheet map that has an index of 0
-def get_default_sheet(sheets):
-    for sheet in sheets:
-        if sheet['properties']['index'] == 0:
-            return sheet
-        
-    return None
+    return len(hidden_rows)
 
-# returns the range of all the sheets values in A1 format
-def get_entire_sheet_range(num_rows, num_cols):
-    return f"A1:{rowcol_to_a1(num_rows, num_cols)}"
+def get_window_anchor_row(layout: SheetLayout):
+    """The row the window of downloaded rows starts at, the first row that is not hidden or frozen"""
+    return get_first_visible_row(layout.hidden_rows, layout.grid_properties.get('frozenRowCount', 0))
 
-# returns true if the cells background color rgb channels are all the same
-# false otherwise
-def get_cell_is_gray(cell):
-    effectiveFormat = cell["effectiveFormat"] if "effectiveFormat" in cell else None
-    backgroundColor = effectiveFormat["backgroundColor"] if effectiveFormat is not None and "backgroundColor" in effectiveFormat else None
-    if backgroundColor is not None:
-        # does not always seem to have all three color channels :(
-        red = backgroundColor['red'] if 'red' in backgroundColor else None
-        green = backgroundColor['green'] if 'green' in backgroundColor else None
-        blue = backgroundColor['blue'] if 'blue' in backgroundColor else None
-        if red == green and green == blue:
-            return True
-        else:
-            return False
+def get_first_window(layout: SheetLayout):
+    """Returns the range of rows [start_row, end_row) that get_rows_around_dates downloads first"""
+    anchor_row = get_window_anchor_row(layout)
+    return anchor_row, min(anchor_row + INITIAL_WINDOW_SIZE, layout.grid_properties['rowCount'])
 
-    return True
+def get_row_data(planner: FetchPlanner, layout: SheetLayout, start_row, end_row):
+    """
+    Downloads rows [start_row, end_row) (0 based) of the given tab.
+    Always returns end_row - start_row rows, the api leaves off empty rows at the end of the range
+    """
+    if start_row >= end_row:
+        return []
 
-# returns true if the cell is a date, false otherwise
-def get_cell_is_date(cell):
-    try:
-        if cell['effectiveFormat']['numberFormat']['type'] == 'DATE':
-            return True
-    except Exception:
-        pass # yeah this is lazy but it works
-    return False
-
-# returns true if the text of a cell is striked through, false otherwise
-def get_cell_is_strkethrough(cell):
-    try:
-        if cell['effectiveFormat']['textFormat']['strikethrough'] == True:
-            return True
-    except Exception:
-        pass # yeah this is lazy but it works
-    return False
+    row_data = planner.get(layout, layout.get_range(start_row, end_row))
+
+    return row_data + [{} for _ in range(end_row - start_row - len(row_data))]
+
+def get_date_bounds(cells):
+    """Returns the earliest and latest date in the given cells, (None, None) if there are no dates"""
+    dates = [cell.value for row in cells for cell in row if isinstance(cell.value, date)]
+    if not dates:
+        return None, None
+    return min(dates), max(dates)
+
+def get_is_window_complete(cells, last_date):
+    """
+    Whether the cells reach past the end of the shift under last_date. A shift ends at the next row of dates, so
+    there has to be a row of dates below the last row with a date on or before last_date. A later date in the same
+    row (like the sunday of the same week) is not enough, the shift rows under it would be cut off
+    """
+    last_needed_row = -1
+    last_date_row = -1
+
+    for row_index, row in enumerate(cells):
+        row_dates = [cell.value for cell in row if isinstance(cell.value, date)]
+        if row_dates:
+            last_date_row = row_index
+            if min(row_dates) <= last_date:
+                last_needed_row = row_index
+
+    return last_date_row > last_needed_row
+
+def get_rows_around_dates(get_rows, num_rows, anchor_row, first_date, last_date):
+    """
+    Downloads only the rows of the calendar needed for the dates between first_date and last_date.
+
+    get_rows(start_row, end_row) downloads rows [start_row, end_row) and returns them as lists of cells with their
+    dates converted. Starts with a window of rows at anchor_row (the first row that is not hidden) and keeps
+    growing it until it reaches a row of dates below the one with last_date (so the shift under last_date is
+    complete, see get_is_window_complete) or the end of the sheet. If first_date is still before the window, the
+    rows above the window are downloaded as a last resort.
 
-def get_sheet_data(api_key, sheet_id):
-    base_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-    key_param = f"key={api_key}"
-    # what fields to return from the api
-    field_mask = "fields=sheets.properties(index,gridProperties(rowCount,columnCount))"
-    r = requests.get(f"{base_url}?{key_param}&{field_mask}")
+    Returns the cells with every row at the same index it has in the sheet, rows that were not downloaded are empty
+    """
+    window_size = INITIAL_WINDOW_SIZE
+    start_row = anchor_row
+    end_row = min(anchor_row + window_size, num_rows)
+    cells = get_rows(start_row, end_row)
+
+    earliest_date, _ = get_date_bounds(cells)
+
+    while end_row < num_rows and not get_is_window_complete(cells, last_date):
+        window_size *= 2
+        new_end_row = min(end_row + window_size, num_rows)
+        logging.info(f"{last_date} not found in rows {start_row} to {end_row}, downloading rows {end_row} to {new_end_row}")
 
-    sheets = r.json()['sheets']
-    default_sheet = get_default_sheet(sheets)
+        cells.extend(get_rows(end_row, new_end_row))
+        end_row = new_end_row
+        earliest_date, _ = get_date_bounds(cells)
 
-    num_rows = default_sheet['properties']['gridProperties']['rowCount']
-    num_cols = default_sheet['properties']['gridProperties']['columnCount']
-    sheet_range = get_entire_sheet_range(num_rows, num_cols)
+    if start_row > 0 and (earliest_date is None or earliest_date > first_date):
+        logging.info(f"{first_date} is before row {start_row}, downloading the rest of the sheet")
+        cells = get_rows(0, start_row) + cells
+        start_row = 0
 
-    # what fields to return from the third api call
-    field_mask = "fields=sheets.data.rowData.values(effectiveFormat(numberFormat,backgroundColor,textFormat.strikethrough),formattedValue)"
-    r = requests.get(f"{base_url}?{key_param}&ranges={sheet_range}&{field_mask}")
+    return [[] for _ in range(start_row)] + cells
 
-    row_data = r.json()['sheets'][0]['data'][0]['rowData']
+def parse_row(row):
+    """Converts a row from the sheets api into a list of cells without the blank cells at the end of the row"""
+    new_row = []
 
-    data = []
+    for cell in row.get('values', []):
+        value = cell['formattedValue'] if 'formattedValue' in cell else ''
 
-    for row in row_data:
-        new_row = []
+        # blank cells are all treated the same no matter their formatting so skip classifying them
+        if value == '':
+            new_row.append(EMPTY_CELL)
+            continue
 
-        for cell in row['values']:
-            is_gray = get_cell_is_gray(cell)
-            is_date = get_cell_is_date(cell)
-            is_strikethrough = get_cell_is_strkethrough(cell)
-            value = cell['formattedValue'] if 'formattedValue' in cell else ''
+        is_gray, is_date, is_strikethrough = get_cell_format(cell)
 
-            new_row.append({"is_gray": is_gray, "is_date": is_date, "is_strikethrough": is_strikethrough, "value": value})
+        # dates come straight from the cells serial number when the api sent it, no text parsing needed
+        if is_date:
+            value = parse_cell_date(cell)
 
-        data.append(new_row)
+        new_row.append(Cell(value, is_gray, is_date, is_strikethrough))
 
-    return data
+    return trim_blank_cells(new_row)
 
 
+def parse_row_with_dates(row):
+    """Same as parse_row but with any dates converted to date objects"""
+    cells = parse_row(row)
+    convert_dates([cells])
+    return cells
+
 def convert_dates(all_cells):
-    for row in range(len(all_cells)):
-        for col in range(len(all_cells[row])):
-            if all_cells[row][col]["is_date"] and len(all_cells[row][col]["value"]) > 0:
-                all_cells[row][col]["value"] = parse(all_cells[row][col]["value"]).date()
+    for row in all_cells:
+        for cell in row:
+            # skip cells that are empty or have already been converted
+            if cell.is_date and type(cell.value) is str and len(cell.value) > 0:
+                cell.value = parse_date_string(cell.value)
 
-def get_date_location(date, all_cells):
+def get_date_location(date, calendar: CalendarGrid):
     """
-    Finds the row and column of the given date in the given cells using 0 based indexing
+    Finds the row and column of the given date in the calendar using 0 based indexing
     Throws an error if the date is not found
 
     """
-    for row_idx, row in enumerate(all_cells):
-        for col_idx, cell in enumerate(row):
-            if cell['value'] == date:
-                return row_idx, col_idx  # Return the first occurrence
-    raise ValueError(f"Date: {date} not found in the calendar")
+    return calendar.get_date_location(date)
 
-def get_voluneers_for_date(date, all_cells):
-    """
-    Returns a tuple of two elements. The first is the list of volunteers for the shift. The second
-    Is the list of special cells, like new volunteer that the shift may need to know about
-    """
-    # find the location of the given date in the worksheet
-    row, col = get_date_location(date, all_cells)
+def send_shift_warning_messages(config: MessageConfig, day_of_week, shift: Shift, tenant: Tenant, today: date = None):
+    send_volunteer_warning_message(config, day_of_week, shift.date, shift.volunteers, shift.has_keyholder(config), tenant, today)
 
-    # increment the row by one to go one cell under the date
-    row = row + 1
+def send_shift_notes_messages(config: MessageConfig, day_of_week, shift: Shift, tenant: Tenant, today: date = None):
+    send_special_note_message(config, day_of_week, shift.date, shift.special_notes, tenant, today)
 
-    all_volunteers = []
-    special_rows = []
+def send_bike_school_reminder_messages(config: MessageConfig, day_of_week, shift: Shift, tenant: Tenant, today: date = None):
+    """Sends a bike school reminder based on the message config"""
+    send_bike_school_message(config, day_of_week, shift.date, shift.special_notes, tenant, today)
 
-    # go down each row until the next date is reached or the end of the sheet is reached
-    while type(all_cells[row][col]['value']) is str and row < len(all_cells):
-        cell = all_cells[row][col]
+# the function that sends each type of message
+MESSAGE_SENDERS = {
+    "shift_warning": send_shift_warning_messages,
+    "shift_notes": send_shift_notes_messages,
+    "bike_school_reminder": send_bike_school_reminder_messages,
+}
 
-        # check if the cell is special or contains volunteer signup info
-        if not cell['is_gray']:
-            special_rows.append(cell['value'])
-        elif not cell['is_strikethrough']:
-            # get volunteers names. The cell may contain multiple volunteers sigining up separated
-            # by commas so split by commas and then remove any leading/trailing whitespace before
-            # adding the volunteers to the volunteers list
-            all_volunteers.extend(item.strip() for item in cell['value'].split(","))
+def send_due_messages(schedule: MessageSchedule, shifts: ShiftTable, today: date, tenant: Tenant):
+    """For each message config due today, check if its message needs to be sent (and send it if needed)"""
+    for scheduled_message in schedule.get_due(today):
+        shift = shifts.get_shift(scheduled_message.shift_date)
 
-        # go down to the next cell
-        row = row + 1
+        if get_should_send(scheduled_message, shift):
+            MESSAGE_SENDERS[scheduled_message.message_type](scheduled_message.config, scheduled_message.day_of_week, shift, tenant)
 
-    # remove any possibly blank cells
-    all_volunteers = [volunteer for volunteer in all_volunteers if volunteer.strip() not in (None, '')]
-    special_rows = [special_row for special_row in special_rows if special_row.strip() not in (None, '')]
+def get_last_message_date(config: Config, today: date):
+    """The date of the furthest ahead shift any message config looks at"""
+    all_message_configs = config.shift_warning + config.shift_notes + config.bike_school_reminder
+    return today + timedelta(days=max((message_config.days_before for message_config in all_message_configs), default=0))
 
-    return all_volunteers, special_rows
+def seed_change_alerts_baseline(snapshot_store: SnapshotStore, tenant: Tenant, shifts: ShiftTable, first_date: date, last_date: date):
+    """Saves the shifts between the dates to the change alerts baseline, except the ones it already has"""
+    snapshot_store.save_shifts(tenant.sheet_id, shifts.get_shifts_between(first_date, last_date), CHANGE_ALERTS_BASELINE, replace=False)
 
-def get_has_keyholder(volunteers, config: MessageConfig):
-    return any(keyholder_mark in volunteer.lower() for keyholder_mark in config.keyholder_marks for volunteer in volunteers)
+def get_last_warning_date(config: Config, today: date):
+    """The date of the furthest ahead shift any shift warning looks at (what change alerts check)"""
+    return today + timedelta(days=max((message_config.days_before for message_config in config.shift_warning), default=0))
 
-def send_shift_warning_messages(config: MessageConfig, all_cells, today: date):
-    date_to_check = today + timedelta(days=config.days_before)
-    day_of_week = DAYS_OF_WEEK[date_to_check.weekday()]
-    
-    if day_of_week in config.days:
-        volunteers, _ = get_voluneers_for_date(date_to_check, all_cells)
-        has_keyholder = get_has_keyholder(volunteers, config)
+def preview_messages(start_date: date, days=30, tenant: Tenant = None):
+    """
+    Returns every message config the bot will look at over the given number of days from start_date, as a list
+    of (ScheduledMessage, would_send). would_send is whether the message would be sent if the calendar stayed the
+    way it is now, None if the shift is not in the calendar. Nothing is sent
+    """
+    tenant = tenant if tenant is not None else get_tenants()[0]
+    planner = FetchPlanner(tenant.sheet_id, os.getenv('google_api_key'))
+    config = get_config(planner, tenant)
 
-        if len(volunteers) < config.volunteer_threshold or not has_keyholder:
-            send_volunteer_warning_message(config, day_of_week, date_to_check, volunteers, has_keyholder)
+    end_date = start_date + timedelta(days=days - 1)
+    schedule = MessageSchedule(config, start_date, end_date)
 
-def send_shift_notes_messages(config: MessageConfig, all_cells, today: date):
-    date_to_check = today + timedelta(days=config.days_before)
-    day_of_week = DAYS_OF_WEEK[date_to_check.weekday()]
+    all_cells = get_sheet_data(planner.api_key, tenant.sheet_id, start_date, get_last_message_date(config, end_date), planner)
+    convert_dates(all_cells)
+    shifts = ShiftTable(CalendarGrid(all_cells))
 
-    if day_of_week in config.days:
-        _, special_cells = get_voluneers_for_date(date_to_check, all_cells)
+    preview = []
+    for scheduled_message in schedule.get_between(start_date, end_date):
+        try:
+            would_send = get_should_send(scheduled_message, shifts.get_shift(scheduled_message.shift_date))
+        except ValueError:
+            would_send = None
+        preview.append((scheduled_message, would_send))
 
-        if special_cells:
-            send_special_note_message(config, day_of_week, date_to_check, special_cells)
+    return preview
 
+# how many tenants are run at the same time. They all share the same pooled connections to google and slack
+MAX_CONCURRENT_TENANTS = 4
 
-def is_bike_school(special_cells, config: MessageConfig):
-    """checks if any of the given special cells contains any of the marks of a bike school event"""
-    lower_special_cells = set([cell.lower() for cell in special_cells])
-    lower_school_marks = [mark.lower() for mark in config.bikeschool_marks]
+def send_slack_messages(today = date.today(), tenants: List[Tenant] = None):
+    """
+    Sends the messages for every tenant (see get_tenants), a few tenants at a time. A tenant failing does not stop
+    the others, the errors are logged and raised together once every tenant is done.
+    Returns the shifts that changed since the last run (see SnapshotStore.update_shifts) by tenant name
+    """
+    tenants = tenants if tenants is not None else get_tenants()
+    if not tenants:
+        return {}
 
-    for cell in lower_special_cells:
-        for mark in lower_school_marks:
-            if mark in cell:
-                return True
-    return False
+    with trace_run("send_slack_messages", today=today.isoformat(), tenants=len(tenants)):
+        return _send_slack_messages(today, tenants)
 
-def send_bike_school_reminder_messages(config: MessageConfig, all_cells, today: date):
-    """Sends a bike school reminder based on the message config"""
-    date_to_check = today + timedelta(days=config.days_before)
-    day_of_week = DAYS_OF_WEEK[date_to_check.weekday()]
+def _send_slack_messages(today: date, tenants: List[Tenant]):
+    errors = TenantErrors("Sending messages", len(tenants))
+    shift_changes = {}
 
-    if day_of_week in config.days:
-        _, special_cells = get_voluneers_for_date(date_to_check, all_cells)
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_TENANTS, len(tenants))) as executor:
+        futures = {tenant.name: executor.submit(wrap(send_tenant_slack_messages), tenant, today) for tenant in tenants}
 
-        if is_bike_school(special_cells, config):
-            send_bike_school_message(config, day_of_week, date_to_check, special_cells)
+        for tenant_name, future in futures.items():
+            try:
+                shift_changes[tenant_name] = future.result()
+            except Exception as e:
+                errors.add(tenant_name, e)
 
-        
+    errors.raise_if_any()
+    return shift_changes
 
-def send_messages_of_type(message_configs: MessageConfig, message_sender: Callable, all_cells, today: date):
-    """For each configured message in the message type, check if a message needs to be sent (and send it if needed)"""
-    for message_config in message_configs:
-        message_sender(message_config, all_cells, today)
+def send_tenant_slack_messages(tenant: Tenant, today: date) -> List[ShiftChange]:
+    """Sends the tenants messages that are due today, returns the shifts that changed since the last run"""
+    with span("tenant", tenant=tenant.name):
+        return _send_tenant_slack_messages(tenant, today)
 
-def send_slack_messages(today = date.today()):
+def _send_tenant_slack_messages(tenant: Tenant, today: date):
     google_api_key = os.getenv('google_api_key')
 
-    # get the entire sheet as a 2D array
-    all_cells = get_sheet_data(google_api_key, SHEET_ID)
-
-    # # converts any strings that are dates into date objects
-    # # if a cell is not a date, leave as is
-    convert_dates(all_cells)
-
-    config = get_config()
-
-    # send a message of each message type based on config for those message types
-    send_messages_of_type(config.shift_warning, send_shift_warning_messages, all_cells, today)
-    send_messages_of_type(config.shift_notes, send_shift_notes_messages, all_cells, today)
-    send_messages_of_type(config.bike_school_reminder, send_bike_school_reminder_messages, all_cells, today)
+    try:
+        # everything this run needs from the calendar spreadsheet goes through one planner so it is downloaded
+        # in as few requests as possible
+        planner = FetchPlanner(tenant.sheet_id, google_api_key)
+
+        # ask for the first window of the calendar before getting the config. If the config sheet needs to be
+        # downloaded and is in the same spreadsheet, both are downloaded in the same request
+        with span("layout"):
+            layout = planner.get_default_sheet_layout()
+            planner.request(layout, layout.get_range(*get_first_window(layout)))
+
+        with span("get_config"):
+            config = get_config(planner, tenant)
+
+        # which message configs are due today and which shifts they look at
+        schedule = MessageSchedule(config, today, today)
+
+        # only the shifts between today and the furthest ahead any message looks are needed, so only those rows
+        # of the sheet are downloaded
+        last_date = get_last_message_date(config, today)
+        # change alerts get a baseline for the shifts up to the day after the ones they check (see below)
+        seed_last_date = get_last_warning_date(config, today) + timedelta(days=1)
+
+        # get the rows of the sheet around those dates as a 2D array
+        with span("get_sheet_data"):
+            all_cells = get_sheet_data(google_api_key, tenant.sheet_id, today, max(last_date, seed_last_date), planner)
+
+        # # converts any strings that are dates into date objects
+        # # if a cell is not a date, leave as is
+        with span("convert_dates"):
+            convert_dates(all_cells)
+
+        with span("parse_shifts"):
+            # index where every date is once so each message config can jump straight to its shift
+            calendar = CalendarGrid(all_cells)
+
+            # parse every shift once up front so each message type reads from the same table
+            shifts = ShiftTable(calendar)
+
+        # compare the upcoming shifts with the last run, the changes are logged and returned to the caller
+        with span("update_snapshot"):
+            snapshot_store = get_snapshot_store()
+            shift_changes = snapshot_store.update_shifts(tenant.sheet_id, shifts.get_shifts_between(today, last_date))
+            # change alerts only notice a drop in a shift they already have a baseline for. Shifts they have not
+            # seen yet (including tomorrows new one) are saved as they are now, the ones they have are left alone
+            seed_change_alerts_baseline(snapshot_store, tenant, shifts, today, seed_last_date)
+        for shift_change in shift_changes:
+            logging.info(f"Shift changed since last run for {tenant.name}: {shift_change}")
+
+        # messages about shifts that are long gone can not be sent again
+        if get_ledger_mode() != "off":
+            get_message_ledger().prune(today - timedelta(days=LEDGER_RETENTION_DAYS))
+
+        # send the messages of the configs that are due today
+        with span("queue_messages"):
+            send_due_messages(schedule, shifts, today, tenant)
+
+        return shift_changes
+    finally:
+        # send everything that was queued, even if something went wrong part way through
+        with span("flush_messages"):
+            flush_messages(tenant.slack_token)
@@ -0,0 +1,145 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+class Cell:
+    """
+    A single cell of the calendar. Uses slots instead of a dict per cell since a calendar that goes back
+    years has tens of thousands of cells
+    """
+    __slots__ = ("is_gray", "is_date", "is_strikethrough", "value")
+
+    def __init__(self, value='', is_gray=True, is_date=False, is_strikethrough=False):
+        self.is_gray = is_gray
+        self.is_date = is_date
+        self.is_strikethrough = is_strikethrough
+        self.value = value
+
+    def __repr__(self):
+        return f"Cell({self.value!r}, is_gray={self.is_gray}, is_date={self.is_date}, is_strikethrough={self.is_strikethrough})"
+
+
+# used for every blank cell and any cell past the end of a row. The formatting of a blank cell never
+# matters so they all share this one cell, it should never be modified
+EMPTY_CELL = Cell()
+
+def trim_blank_cells(row):
+    """Removes the blank cells at the end of the row (the sheet pads every row out to the column count)"""
+    end = len(row)
+    while end > 0 and row[end - 1].value == '':
+        end -= 1
+    del row[end:]
+    return row
+
+
+def iter_set_bits(mask):
+    """Yields the index of every set bit in the mask from lowest to highest"""
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+def get_lowest_set_bit(mask):
+    """Returns the index of the lowest set bit in the mask, -1 if no bits are set"""
+    return (mask & -mask).bit_length() - 1
+
+
+class CalendarGrid:
+    """
+    The calendar sheet as a 2D array of cells along with an index of where each date is in the sheet.
+    The index is built once so looking up a date does not require scanning the whole sheet again
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+
+        # map of date -> (row, col) using 0 based indexing
+        self._date_locations = {}
+
+        # for each column, which rows have a date, a special (non gray) cell and a volunteer (gray and not striked
+        # through) cell. Each is a bitset with bit n set for row n, built up as bytes and converted to ints at the end
+        num_bytes = (len(cells) + 7) // 8
+        date_bits = []
+        special_bits = []
+        volunteer_bits = []
+
+        for row_idx, row in enumerate(cells):
+            byte_idx = row_idx >> 3
+            bit = 1 << (row_idx & 7)
+
+            while len(date_bits) < len(row):
+                date_bits.append(bytearray(num_bytes))
+                special_bits.append(bytearray(num_bytes))
+                volunteer_bits.append(bytearray(num_bytes))
+
+            for col_idx, cell in enumerate(row):
+                if cell is EMPTY_CELL:
+                    continue
+
+                value = cell.value
+                if type(value) is str:
+                    if value == '':
+                        continue
+                    if not cell.is_gray:
+                        special_bits[col_idx][byte_idx] |= bit
+                    elif not cell.is_strikethrough:
+                        volunteer_bits[col_idx][byte_idx] |= bit
+                elif isinstance(value, date):
+                    date_bits[col_idx][byte_idx] |= bit
+                    # only keep the first occurrence of a date, same as scanning the sheet top to bottom
+                    if value not in self._date_locations:
+                        self._date_locations[value] = (row_idx, col_idx)
+
+        self._date_masks = [int.from_bytes(bits, 'little') for bits in date_bits]
+        self._special_masks = [int.from_bytes(bits, 'little') for bits in special_bits]
+        self._volunteer_masks = [int.from_bytes(bits, 'little') for bits in volunteer_bits]
+
+        # sorted list of every date in the sheet so ranges of dates can be looked up with a binary search
+        self._sorted_dates = sorted(self._date_locations)
+
+    @property
+    def num_rows(self):
+        return len(self.cells)
+
+    def get_cell(self, row, col):
+        """Returns the cell at the given row and column (0 based), rows that are too short are treated as blank"""
+        cells_in_row = self.cells[row]
+        if col < len(cells_in_row):
+            return cells_in_row[col]
+        return EMPTY_CELL
+
+    def get_column_masks(self, col):
+        """
+        Returns the (dates, special cells, volunteer cells) bitsets of the column, bit n of each being set if
+        row n has that kind of cell. Blank cells are in none of them
+        """
+        if col < len(self._date_masks):
+            return self._date_masks[col], self._special_masks[col], self._volunteer_masks[col]
+        return 0, 0, 0
+
+    def get_dates(self):
+        """Returns every date in the calendar in order"""
+        return list(self._sorted_dates)
+
+    def has_date(self, date_to_find):
+        return date_to_find in self._date_locations
+
+    def get_date_location(self, date_to_find):
+        """
+        Finds the row and column of the given date using 0 based indexing
+        Throws an error if the date is not found
+        """
+        try:
+            return self._date_locations[date_to_find]
+        except KeyError:
+            raise ValueError(f"Date: {date_to_find} not found in the calendar")
+
+    def get_dates_between(self, start_date, end_date):
+        """Returns every date in the calendar between start_date and end_date (inclusive on both ends) in order"""
+        start = bisect_left(self._sorted_dates, start_date)
+        end = bisect_right(self._sorted_dates, end_date)
+        return self._sorted_dates[start:end]
+
+    def get_date_locations_between(self, start_date, end_date):
+        """Returns a list of (date, (row, col)) for every date in the calendar between start_date and end_date (inclusive)"""
+        return [(found_date, self._date_locations[found_date]) for found_date in self.get_dates_between(start_date, end_date)]
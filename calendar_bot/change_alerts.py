@@ -0,0 +1,190 @@
+"""
+Warns about shifts as soon as they stop being covered instead of waiting for the next daily run. Google Drive sends
+a push notification to the drive_notification trigger whenever the calendar spreadsheet changes (see
+watch_calendar), the notifications are recorded as pending changes and checked once the sheet has stopped changing
+for a bit (check_pending_changes, run every minute by a timer).
+
+Checking only downloads the rows of the days the warnings look ahead to, and only warns about shifts that changed
+since the last check (see SnapshotStore, change alerts keep their own baseline apart from the daily run) and went
+from covered to not covered
+"""
+import os
+import hmac
+import time
+import uuid
+import secrets
+import logging
+from datetime import date, timedelta
+from typing import List
+
+from calendar_bot.calendar_bot import get_sheet_data, get_first_window, convert_dates, get_last_warning_date, seed_change_alerts_baseline
+from calendar_bot.calendar_grid import CalendarGrid
+from calendar_bot.config import DAYS_OF_WEEK, Config, MessageConfig, get_config
+from calendar_bot.fetch_planner import FetchPlanner
+from calendar_bot.shifts import Shift, ShiftTable
+from calendar_bot.slack import CHANGE_ALERT, send_volunteer_warning_message
+from calendar_bot.slack_client import flush_messages
+from calendar_bot.snapshot_store import CHANGE_ALERTS_BASELINE, ShiftChange, get_snapshot_store
+from calendar_bot.tenants import Tenant, TenantErrors, get_tenants
+from calendar_bot.tracing import span, trace_run
+
+# notifications keep coming while someone is editing, a sheet is only checked once it has not changed for this long
+CHANGE_QUIET_SECONDS = 60
+# but a sheet that never stops changing is still checked after this long
+CHANGE_MAX_WAIT_SECONDS = 300
+
+# how long a watch lasts before it has to be registered again, drive does not allow more than a day for a file
+WATCH_TTL_SECONDS = 24 * 60 * 60
+
+
+def watch_calendar(tenant: Tenant, address, channel_id=None, ttl_seconds=WATCH_TTL_SECONDS):
+    """
+    Asks drive to send a notification to address (the url of the drive_notification trigger) whenever the tenants
+    calendar changes. Each watch gets a random secret token that drive sends back with every notification, it is
+    saved with the watch so notifications that do not come from drive are rejected (see handle_drive_notification).
+    Watches expire, so this has to be called again before ttl_seconds are up. Returns the watch channel
+    """
+    from calendar_bot.sheets_writer import get_drive_service
+
+    channel = {
+        "id": channel_id if channel_id is not None else str(uuid.uuid4()),
+        "type": "web_hook",
+        "address": address,
+        "token": secrets.token_urlsafe(32),
+        "expiration": int((time.time() + ttl_seconds) * 1000),
+    }
+
+    response = get_drive_service().files().watch(fileId=tenant.sheet_id, body=channel).execute()
+    expiration = int(response.get('expiration', channel['expiration'])) / 1000
+    get_snapshot_store().add_watch(response['id'], tenant.sheet_id, response['resourceId'], channel['token'], expiration)
+
+    logging.info(f"Watching {tenant.name} for changes until {response.get('expiration')}: {response.get('id')}")
+    return response
+
+def watch_calendars(address, tenants: List[Tenant] = None):
+    """Registers (or renews) a watch on every tenants calendar"""
+    tenants = tenants if tenants is not None else get_tenants()
+    for tenant in tenants:
+        try:
+            watch_calendar(tenant, address)
+        except Exception:
+            logging.exception(f"Watching {tenant.name} for changes failed")
+
+def handle_drive_notification(headers, tenants: List[Tenant] = None) -> bool:
+    """
+    Records a change to a tenants calendar from the headers of a drive push notification. Returns False if the
+    notification is not for a watch this bot registered, or its resource id or token do not match the watch
+    """
+    headers = {key.lower(): value for key, value in headers.items()}
+    state = headers.get('x-goog-resource-state')
+    channel_id = headers.get('x-goog-channel-id')
+
+    watch = get_snapshot_store().get_watch(channel_id) if channel_id else None
+    if watch is None:
+        logging.warning(f"Drive notification for unknown watch {channel_id}")
+        return False
+
+    if headers.get('x-goog-resource-id') != watch.resource_id or not hmac.compare_digest(headers.get('x-goog-channel-token', ''), watch.token):
+        logging.warning(f"Drive notification for watch {channel_id} does not match it, ignoring it")
+        return False
+
+    tenants = tenants if tenants is not None else get_tenants()
+    tenant = next((tenant for tenant in tenants if tenant.sheet_id == watch.sheet_id), None)
+    if tenant is None:
+        logging.warning(f"Drive notification for {watch.sheet_id}, which is not the calendar of any tenant")
+        return False
+
+    # sync is sent once when the watch is created, nothing changed
+    if state == 'sync':
+        logging.info(f"Drive is now sending changes for {tenant.name}")
+        return True
+
+    get_snapshot_store().add_pending_change(tenant.sheet_id)
+    return True
+
+def check_pending_changes(today=None, tenants: List[Tenant] = None):
+    """Checks every tenant whose calendar changed and has since stopped changing. A tenant failing does not stop the others"""
+    today = today if today is not None else date.today()
+    tenants = tenants if tenants is not None else get_tenants()
+
+    snapshot_store = get_snapshot_store()
+    pending_changes = {pending_change.sheet_id: pending_change for pending_change in snapshot_store.get_settled_changes(CHANGE_QUIET_SECONDS, CHANGE_MAX_WAIT_SECONDS)}
+    changed_tenants = [tenant for tenant in tenants if tenant.sheet_id in pending_changes]
+    if not changed_tenants:
+        return
+
+    errors = TenantErrors("Checking changes", len(changed_tenants))
+
+    with trace_run("check_pending_changes", today=today.isoformat(), tenants=len(changed_tenants)):
+        for tenant in changed_tenants:
+            try:
+                with span("tenant", tenant=tenant.name):
+                    check_tenant_changes(tenant, today)
+            except Exception as e:
+                # the change stays pending and is checked again on the next run
+                errors.add(tenant.name, e)
+            else:
+                snapshot_store.remove_pending_change(pending_changes[tenant.sheet_id])
+
+    errors.raise_if_any()
+
+def get_previous_shift(shift: Shift, change: ShiftChange) -> Shift:
+    """The shift as it was before the change"""
+    volunteers = [volunteer for volunteer in shift.volunteers if volunteer not in change.added_volunteers] + change.removed_volunteers
+    special_notes = [note for note in shift.special_notes if note not in change.added_notes] + change.removed_notes
+    return Shift(shift.date, volunteers, special_notes)
+
+def get_is_in_warning_window(config: MessageConfig, shift_date: date, today: date):
+    """Whether the config would warn about the shift on some day between today and the shift"""
+    return DAYS_OF_WEEK[shift_date.weekday()] in config.days and today <= shift_date <= today + timedelta(days=config.days_before)
+
+def check_tenant_changes(tenant: Tenant, today: date):
+    """Sends a warning for every shift inside a warnings window that changed and now needs a warning but did not before"""
+    google_api_key = os.getenv('google_api_key')
+
+    try:
+        planner = FetchPlanner(tenant.sheet_id, google_api_key)
+        layout = planner.get_default_sheet_layout()
+        planner.request(layout, layout.get_range(*get_first_window(layout)))
+
+        config = get_config(planner, tenant)
+        last_date = get_last_warning_date(config, today)
+
+        snapshot_store = get_snapshot_store()
+        with span("get_sheet_data"):
+            # one day further than checked, so tomorrows new shift already has a baseline when it is checked
+            all_cells = get_sheet_data(google_api_key, tenant.sheet_id, today, last_date + timedelta(days=1), planner)
+            convert_dates(all_cells)
+
+        shifts = ShiftTable(CalendarGrid(all_cells))
+        checked_shifts = shifts.get_shifts_between(today, last_date)
+        shift_changes = snapshot_store.get_shift_changes(tenant.sheet_id, checked_shifts, CHANGE_ALERTS_BASELINE)
+
+        for shift_change in shift_changes:
+            logging.info(f"Shift changed for {tenant.name}: {shift_change}")
+            send_change_warnings(config, shifts.get_shift(shift_change.date), shift_change, today, tenant)
+    finally:
+        num_sent, num_failed = flush_messages(tenant.slack_token)
+
+    # the shifts are only saved once every alert about them was sent, otherwise the change stays pending and is
+    # checked (and alerted about) again
+    if num_failed:
+        raise Exception(f"{num_failed} change alerts for {tenant.name} could not be sent")
+
+    snapshot_store.save_shifts(tenant.sheet_id, checked_shifts, CHANGE_ALERTS_BASELINE)
+    seed_change_alerts_baseline(snapshot_store, tenant, shifts, last_date + timedelta(days=1), last_date + timedelta(days=1))
+
+def send_change_warnings(config: Config, shift: Shift, change: ShiftChange, today: date, tenant: Tenant):
+    previous_shift = get_previous_shift(shift, change)
+    # several configs can cover the same shift (like warnings 6 and 3 days before), one warning per channel is enough
+    warned_channels = set()
+
+    for message_config in config.shift_warning:
+        if not get_is_in_warning_window(message_config, shift.date, today) or message_config.channel in warned_channels:
+            continue
+
+        # only when this change is what made the shift need a warning, not for every edit to a shift that already did
+        if shift.needs_warning(message_config) and not previous_shift.needs_warning(message_config):
+            day_of_week = DAYS_OF_WEEK[shift.date.weekday()]
+            send_volunteer_warning_message(message_config, day_of_week, shift.date, shift.volunteers, shift.has_keyholder(message_config), tenant, today, CHANGE_ALERT)
+            warned_channels.add(message_config.channel)
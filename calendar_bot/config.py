@@ -1,13 +1,18 @@
 import os
 import json
 import logging
+import hashlib
 import time
+import threading
 import traceback
-import requests
-from dataclasses import dataclass, field
-from typing import List, Optional
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+from dataclasses import dataclass, field, asdict
+from typing import Callable, List, Optional
+
+from calendar_bot.sheets_client import get_modified_time, rowcol_to_a1
+from calendar_bot.fetch_planner import FetchPlanner
+from calendar_bot.config_cache import get_default_config_cache
+from calendar_bot.slack_client import send_message
+from calendar_bot.tenants import Tenant, get_default_tenant
 
 from pprint import pprint
 
@@ -15,15 +20,6 @@ from pprint import pprint
 DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
 
-def get_config_from_environment(key_name, default=None):
-    value = os.getenv(key_name)
-    if value == None:
-        if default != None:
-            return default
-        raise Exception(f"Environment Variable {key_name} is required")
-
-    return value
-
 @dataclass
 class MessageConfig:
     days: List[str]
@@ -53,6 +49,13 @@ class Config:
     shift_notes: List[MessageConfig]
     bike_school_reminder: List[MessageConfig]
 
+def config_from_dict(data_dict) -> Config:
+    shift_warning = [MessageConfig(**msg_config) for msg_config in data_dict['shift_warning']]
+    shift_notes = [MessageConfig(**msg_config) for msg_config in data_dict['shift_notes']]
+    bike_school_reminder = [MessageConfig(**msg_config) for msg_config in data_dict['bike_school_reminder']]
+
+    return Config(shift_warning=shift_warning, shift_notes=shift_notes, bike_school_reminder=bike_school_reminder)
+
 def get_config_fallback() -> Config:
     with open("./calendar_bot/config.json", "r") as file:
         raw_config = os.getenv("calendar_bot_config")
@@ -62,145 +65,101 @@ def get_config_fallback() -> Config:
         else:
             data_dict = json.load(file)
 
-        shift_warning = [MessageConfig(**msg_config) for msg_config in data_dict['shift_warning']]
-        shift_notes = [MessageConfig(**msg_config) for msg_config in data_dict['shift_notes']]
-        bike_school_reminder = [MessageConfig(**msg_config) for msg_config in data_dict['bike_school_reminder']]
-
-        return Config(shift_warning=shift_warning, shift_notes=shift_notes, bike_school_reminder=bike_school_reminder)
+        return config_from_dict(data_dict)
     raise Exception("Failed to open file and get config")
 
 #
 # START OF GET CONFIG CODE FROM GOOGLE SHPREADSHEET
 #
 
-# some code had to be repeated to avoid circular imports
-def _send_message_internal(channel_id, message, use_blocks, fallback_text):
-    slack_token = os.getenv('slack_token')
-    client = WebClient(token=slack_token)
-
-    if use_blocks:
-        return client.chat_postMessage(
-            channel=channel_id,
-            text=fallback_text,
-            blocks=message
-        )
-    
-    return client.chat_postMessage(
-        channel=channel_id,
-        text=message,
-    )
-
-def send_message(channel_id, message, use_blocks=False, fallback_text=None):
-    """Send the given message to the specified channel and respect rate limits"""
-    try:
-        # Sending a message to the specified Slack channel
-        _send_message_internal(channel_id, message, use_blocks, fallback_text)
-        logging.info(f"Message sent successfully")
-    except SlackApiError as e:
-        if e.response.status_code == 429:
-            # The `Retry-After` header will tell you how long to wait before retrying
-            delay = int(e.response.headers['Retry-After'])
-            print(f"Rate limited. Retrying in {delay} seconds")
-            time.sleep(delay)
-            _send_message_internal(channel_id, message, use_blocks, fallback_text)
-        else:
-            logging.error(f"Error sending message: {e}")
-
-def get_row_and_column_count(sheets, gid):
-    for sheet in sheets:
-        if str(sheet['properties']['sheetId']) == str(gid):
-            gridProps = sheet['properties']['gridProperties']
-            return sheet['properties']['title'], gridProps['rowCount'], gridProps['columnCount']
-    raise Exception("Sheet GID not found: " + str(gid) + str(sheets))
-        
-## shamelessly stolen from gspread
-def rowcol_to_a1(row: int, col: int) -> str:
-    """Translates a row and column cell address to A1 notation.
-
-    :param row: The row of the cell to be converted.
-        Rows start at index 1.
-    :type row: int, str
-
-    :param col: The column of the cell to be converted.
-        Columns start at index 1.
-    :type row: int, str
-
-    :returns: a string containing the cell's coordinates in A1 notation.
-
-    Example:
-
-    >>> rowcol_to_a1(1, 1)
-    A1
-
+def get_sheet_data(sheet_id, gid, planner: FetchPlanner = None):
     """
+    Returns the values of the tab with the given gid as a 2D array of strings.
+    Pass in a planner for the spreadsheet to download it along with anything else requested from that spreadsheet
+    """
+    planner = planner if planner is not None else FetchPlanner(sheet_id, os.getenv('google_api_key'))
+    layout = planner.get_sheet_layout(gid)
 
-    div = col
-    column_label = ""
-
-    while div:
-        (div, mod) = divmod(div, 26)
-        if mod == 0:
-            mod = 26
-            div -= 1
-        column_label = chr(mod + 64) + column_label
-
-    label = "{}{}".format(column_label, row)
-
-    return label
-
-# returns the range of all the sheets values in A1 format
-def get_entire_sheet_range(sheet_title, num_rows, num_cols):
-    return f"{sheet_title}!A1:{rowcol_to_a1(num_rows, num_cols)}"
-
-def get_sheet_row_data(sheets, gid):
-    for sheet in sheets:
-        if str(sheet['properties']['sheetId']) == str(gid):
-            return sheet['data'][0]['rowData']
-    raise Exception("Sheet GID not found: " + str(gid))
-
+    # the whole tab, no need to know how big it is first
+    return planner.get(layout, layout.get_range(), parse_config_row)
 
-def get_sheet_data(sheet_id, gid):
-    api_key = os.getenv('google_api_key')
+def parse_config_row(row):
+    """Returns the values of a row from the sheets api as a list of strings"""
+    return [cell['formattedValue'] if 'formattedValue' in cell else '' for cell in row.get('values', [])]
 
-    base_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-    key_param = f"key={api_key}"
-    # what fields to return from the api
-    field_mask = "fields=sheets.properties(title,sheetId,gridProperties(rowCount,columnCount))"
+class ConfigError(Exception):
+    """A config sheet that does not match CONFIG_BLOCKS, with every problem found and the cell (A1) it is in"""
 
-    r = requests.get(f"{base_url}?{key_param}&{field_mask}")
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} problem(s) in the config sheet: " + "; ".join(errors))
 
-    sheets = r.json()['sheets']
 
-    sheet_title, num_rows, num_cols = get_row_and_column_count(sheets, gid)
+@dataclass
+class ConfigField:
+    """A row of a config block, offset rows below the "Send on" row, and how to read its cells"""
+    name: str
+    label: str
+    offset: int
+    parse: Callable[[str], object]
 
-    sheet_range = get_entire_sheet_range(sheet_title, num_rows, num_cols)
 
-    # what fields to return from the third api call
-    field_mask = "fields=sheets(properties.sheetId,data.rowData.values.formattedValue)"
-    r = requests.get(f"{base_url}?{key_param}&ranges={sheet_range}&{field_mask}")
+@dataclass
+class MessageBlock:
+    """The rows of a config block for one type of message. A message config is made for every checked enabled cell"""
+    message_type: str
+    enabled: ConfigField
+    fields: List[ConfigField]
 
-    row_data = get_sheet_row_data(r.json()['sheets'], gid)
 
-    data = []
+@dataclass
+class ConfigBlock:
+    """A block of the config sheet. It starts with a "<prefix><day>" cell, the shift day the messages are about"""
+    prefix: str
+    messages: List[MessageBlock]
 
-    for row in row_data:
-        new_row = []
 
-        if 'values' in row:
-            for cell in row['values']:
-                value = cell['formattedValue'] if 'formattedValue' in cell else ''
+def parse_day(value):
+    if value not in DAYS_OF_WEEK:
+        raise ValueError(f"'{value}' is not a day, must be one of {', '.join(DAYS_OF_WEEK)}")
+    return DAYS_OF_WEEK.index(value)
 
-                new_row.append(value)
+def parse_checkbox(value):
+    if value not in ("TRUE", "FALSE", ""):
+        raise ValueError(f"'{value}' is not a checkbox (TRUE or FALSE)")
+    return value == "TRUE"
 
-        data.append(new_row)
+def parse_whole_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a whole number")
 
-    return data
+def parse_text(value):
+    return value
 
-def get_day_index(day_text):
-    day_index = DAYS_OF_WEEK.index(day_text)
-    if day_index == -1:
-        raise Exception("Shift day not recognized, must be one of " + DAYS_OF_WEEK)
-    return day_index
+# the layout of the config sheet. Offsets are rows below the "Send on" row (the row after the block header), which has
+# the day each column sends on in the 7 columns right of the header
+SEND_ON = ConfigField("day_to_send", "Send on", 0, parse_day)
+
+CONFIG_BLOCKS = [
+    ConfigBlock("Shift: ", [
+        MessageBlock("shift_warning", ConfigField("enabled", "Warning", 1, parse_checkbox), [
+            ConfigField("notify_channel", "Notify channel", 2, parse_checkbox),
+            ConfigField("channel", "Channel", 3, parse_text),
+            ConfigField("volunteer_threshold", "Volunteer threshold", 4, parse_whole_number),
+        ]),
+        MessageBlock("shift_notes", ConfigField("enabled", "Notes", 6, parse_checkbox), [
+            ConfigField("channel", "Notes channel", 7, parse_text),
+        ]),
+    ]),
+    ConfigBlock("Bike School Reminder: ", [
+        MessageBlock("bike_school_reminder", ConfigField("enabled", "Reminder", 1, parse_checkbox), [
+            ConfigField("notify_channel", "Notify channel", 2, parse_checkbox),
+            ConfigField("channel", "Channel", 3, parse_text),
+        ]),
+    ]),
+]
 
 def get_days_before(target_day, day_to_send):
     if day_to_send <= target_day:
@@ -208,103 +167,160 @@ def get_days_before(target_day, day_to_send):
     else:
         return target_day + len(DAYS_OF_WEEK) - day_to_send
 
-def get_config_locations(data):
-    config_locations = []
-
-    for rowIdx, row in enumerate(data):
-        for colIdx, cell in enumerate(row):
-            if cell.startswith("Shift: ") or cell.startswith('Bike School Reminder: '):
-                configType = "shift" if cell.startswith("Shift: ") else "bike school"
-                dayIndex = get_day_index(cell.split(": ", 1)[1])
-                
-                config_locations.append({
-                    "type": configType,
-                    "day": dayIndex,
-                    "row": rowIdx + 1, # increment by one to get to first row of config data
-                    "col": colIdx + 1 # increment by one to get to frist column of config data
-                })
-    return config_locations
-
-def get_shift_warnings_from_location(data, config_location):
-    row_start = config_location['row']
-    col_start = config_location['col']
-    target_day_index = config_location['day']
-    target_day = DAYS_OF_WEEK[target_day_index]
-
-    shift_warnings = []
-
-    for col in range(col_start, col_start + len(DAYS_OF_WEEK), 1):
-        if data[row_start + 1][col] == 'TRUE':
-            day_to_send_index = get_day_index(data[row_start][col]) 
+def get_block_headers(data):
+    """One pass over the sheet for the cells that start a config block, as (row, col, block, day text)"""
+    headers = []
+    for row_index, row in enumerate(data):
+        for col_index, cell in enumerate(row):
+            for block in CONFIG_BLOCKS:
+                if cell.startswith(block.prefix):
+                    headers.append((row_index, col_index, block, cell[len(block.prefix):]))
+                    break
+    return headers
+
+def compile_block(data, row_index, col_index, block: ConfigBlock, day_text, config: Config, errors: List[str]):
+    """Adds the message configs of the block with its header at (row_index, col_index) to config, problems to errors"""
+
+    def read(field: ConfigField, col):
+        # rows and cells past the end of the data are empty cells in the sheet
+        row = row_index + 1 + field.offset
+        value = data[row][col] if row < len(data) and col < len(data[row]) else ""
+        try:
+            return field.parse(value)
+        except ValueError as e:
+            errors.append(f"{rowcol_to_a1(row + 1, col + 1)} ({field.label} of {block.prefix}{day_text}): {e}")
+            return None
 
-            days_before = get_days_before(target_day_index, day_to_send_index)
-            notify_channel = data[row_start + 2][col] == 'TRUE'
-            channel = data[row_start + 3][col]
-            volunteer_threshold = int(data[row_start + 4][col])
-
-            shift_warnings.append(MessageConfig([target_day], days_before, notify_channel, volunteer_threshold=volunteer_threshold, channel=channel))
-
-    return shift_warnings
-
-def get_shift_notes_from_location(data, config_location):
-    row_start = config_location['row']
-    col_start = config_location['col']
-    target_day_index = config_location['day']
+    try:
+        target_day_index = parse_day(day_text)
+    except ValueError as e:
+        errors.append(f"{rowcol_to_a1(row_index + 1, col_index + 1)}: {e}")
+        return
     target_day = DAYS_OF_WEEK[target_day_index]
 
-    shift_notes = []
+    for message in block.messages:
+        message_configs = getattr(config, message.message_type)
+
+        for col in range(col_index + 1, col_index + 1 + len(DAYS_OF_WEEK)):
+            if not read(message.enabled, col):
+                continue
 
-    for col in range(col_start, col_start + len(DAYS_OF_WEEK), 1):
-        if data[row_start + 6][col] == 'TRUE':
-            day_to_send_index = get_day_index(data[row_start][col]) 
+            day_to_send_index = read(SEND_ON, col)
+            values = {field.name: read(field, col) for field in message.fields}
+            if day_to_send_index is None or None in values.values():
+                continue
 
             days_before = get_days_before(target_day_index, day_to_send_index)
-            channel = data[row_start + 7][col]
+            notify_channel = values.pop("notify_channel", False)
+            message_configs.append(MessageConfig([target_day], days_before, notify_channel, **values))
 
-            shift_notes.append(MessageConfig([target_day], days_before, False, channel=channel))
+def parse_config(data) -> Config:
+    """
+    Builds the config from the values of the config sheet, laid out as CONFIG_BLOCKS describes.
+    Raises a ConfigError with every problem in the sheet (not just the first) if it does not match
+    """
+    config = Config([], [], [])
+    errors = []
 
-    return shift_notes
+    for row_index, col_index, block, day_text in get_block_headers(data):
+        compile_block(data, row_index, col_index, block, day_text, config, errors)
 
-def get_bike_school_reminders_from_location(data, config_location):
-    row_start = config_location['row']
-    col_start = config_location['col']
-    target_day_index = config_location['day']
-    target_day = DAYS_OF_WEEK[target_day_index]
+    if errors:
+        raise ConfigError(errors)
+    return config
 
-    bike_reminders = []
+def get_content_hash(data):
+    return hashlib.sha256(json.dumps(data).encode("utf-8")).hexdigest()
 
-    for col in range(col_start, col_start + len(DAYS_OF_WEEK), 1):
-        if data[row_start + 1][col] == 'TRUE':
-            day_to_send_index = get_day_index(data[row_start][col]) 
+# compiled configs by the content hash of the sheet they were compiled from, so a warm function reuses the same
+# Config instead of building it from the cache entry every run
+_compiled_configs = {}
+_compiled_configs_lock = threading.Lock()
 
-            days_before = get_days_before(target_day_index, day_to_send_index)
-            notify_channel = data[row_start + 2][col] == 'TRUE'
-            channel = data[row_start + 3][col]
+def get_cached_config(cached) -> Config:
+    """The config of a cache entry. Raises the ConfigError again if the sheet it was made from was broken"""
+    if cached.get('errors'):
+        raise ConfigError(cached['errors'])
 
-            bike_reminders.append(MessageConfig([target_day], days_before, notify_channel, channel=channel))
+    with _compiled_configs_lock:
+        config = _compiled_configs.get(cached['content_hash'])
+        if config is None:
+            config = _compiled_configs[cached['content_hash']] = config_from_dict(cached['config'])
+        return config
 
-    return bike_reminders
+# parsed configs are cached so a warm function does not download the config sheet every run.
+# Created the first time it is needed so importing this module does not read any settings
+_config_cache = None
+_config_cache_lock = threading.Lock()
 
-def update_config(config, data, config_location):
-    if config_location['type'] == 'shift':
-        config.shift_warning.extend(get_shift_warnings_from_location(data, config_location))
-        config.shift_notes.extend(get_shift_notes_from_location(data, config_location))
-    elif config_location['type'] == 'bike school':
-        config.bike_school_reminder.extend(get_bike_school_reminders_from_location(data, config_location))
+def get_config_cache():
+    global _config_cache
+    with _config_cache_lock:
+        if _config_cache is None:
+            _config_cache = get_default_config_cache()
+        return _config_cache
 
+def get_config(planner: FetchPlanner = None, tenant: Tenant = None) -> Config:
+    """
+    Returns the config from the tenants config sheet (or the cache), the default tenant if none is given.
+    If the config sheet is in the same spreadsheet as the given planner, it is downloaded with the planner so it
+    shares a request with the calendar
+    """
+    tenant = tenant if tenant is not None else get_default_tenant()
+    config_cache = get_config_cache()
 
-def get_config() -> Config:
     try:
-        configSheetId = get_config_from_environment('CONFIG_SHEET_ID')
-        configSheetGid = get_config_from_environment('CONFIG_SHEET_GID')
-
-        data = get_sheet_data(configSheetId, configSheetGid)
-
-        config_locations = get_config_locations(data)
-        config = Config([], [], [])
-
-        for config_location in config_locations:
-            update_config(config, data, config_location)
+        configSheetId = tenant.config_sheet_id
+        configSheetGid = tenant.config_sheet_gid
+        if configSheetId is None or configSheetGid is None:
+            raise Exception(f"Tenant {tenant.name} has no config sheet")
+
+        cache_key = f"{configSheetId}:{configSheetGid}"
+        cached = config_cache.get(cache_key)
+        now = time.time()
+
+        # checked recently enough that it is assumed to still be up to date
+        if cached is not None and config_cache.is_fresh(cached, now):
+            return get_cached_config(cached)
+
+        # cheap check if the sheet has been modified at all since it was cached
+        modified_time = get_modified_time(configSheetId, os.getenv('google_api_key'))
+        if cached is not None and modified_time is not None and modified_time == cached['modified_time']:
+            logging.info("Config sheet has not been modified, using cached config")
+            config_cache.put(cache_key, dict(cached, checked_at=now))
+            return get_cached_config(cached)
+
+        config_planner = planner if planner is not None and planner.spreadsheet_id == configSheetId else None
+        data = get_sheet_data(configSheetId, configSheetGid, config_planner)
+
+        # the modified time also changes when another tab of the spreadsheet changes (like the calendar),
+        # so only reparse if the config tab itself changed
+        content_hash = get_content_hash(data)
+        if cached is not None and content_hash == cached['content_hash']:
+            logging.info("Config sheet values have not changed, using cached config")
+            config_cache.put(cache_key, dict(cached, modified_time=modified_time, checked_at=now))
+            return get_cached_config(cached)
+
+        try:
+            config = parse_config(data)
+        except ConfigError as e:
+            # a broken sheet is remembered too, so it is not downloaded and compiled again until it changes
+            config_cache.put(cache_key, {
+                "modified_time": modified_time,
+                "content_hash": content_hash,
+                "checked_at": now,
+                "errors": e.errors,
+            })
+            raise
+
+        config_cache.put(cache_key, {
+            "modified_time": modified_time,
+            "content_hash": content_hash,
+            "checked_at": now,
+            "config": asdict(config),
+        })
+        with _compiled_configs_lock:
+            _compiled_configs[content_hash] = config
 
         # pprint(config)
         return config
@@ -315,11 +331,9 @@ def get_config() -> Config:
         error_msg = "Bot encountered error parsing google sheet config. Falling back to default config. Error: " + str(e) + " Stack trace: " + stack_trace
         logging.info(error_msg)
         
-        send_message("#bot-tester", error_msg)
+        if tenant.message_sink is not None:
+            tenant.message_sink(tenant.error_channel, error_msg)
+        else:
+            send_message(tenant.error_channel, error_msg, token=tenant.slack_token)
         
-        return get_config_fallback()        
-
-# Can find in the URL: https://docs.google.com/spreadsheets/d/{SHEET_ID}/
-SHEET_ID = get_config_from_environment('SHEET_ID')
-# must be of the form https://docs.google.com/spreadsheets/d/{SHEET_ID}/edit
-SHEET_URL=f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/edit"
+        return get_config_fallback()
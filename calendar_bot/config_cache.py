@@ -0,0 +1,62 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+import time
+
+# how long a cached config is used without checking if the config sheet has changed
+DEFAULT_TTL_SECONDS = 15 * 60
+
+
+class ConfigCache:
+    """
+    Keeps parsed configs in memory for the life of the process and in a json file so a new process (cold start)
+    can pick up where the last one left off. The file can be on the functions temp disk or a mounted file share.
+
+    Each entry is a dict with at least "checked_at" (unix time the entry was last known to be up to date)
+    """
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        # write to a temp file first so a crash half way through never leaves a broken cache file
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(self._entries, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save config cache to {self.path}: {e}")
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, entry):
+        with self._lock:
+            self._load()[key] = entry
+            self._save()
+
+    def is_fresh(self, entry, now=None):
+        now = now if now is not None else time.time()
+        return now - entry['checked_at'] < self.ttl_seconds
+
+
+def get_default_config_cache() -> ConfigCache:
+    path = os.getenv('config_cache_path', os.path.join(tempfile.gettempdir(), "calendar_bot_config_cache.json"))
+    ttl_seconds = int(os.getenv('config_cache_ttl_seconds', DEFAULT_TTL_SECONDS))
+    return ConfigCache(path, ttl_seconds)
@@ -0,0 +1,100 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+# google sheets stores dates as the number of days since 1899-12-30
+SERIAL_EPOCH = date(1899, 12, 30)
+
+# sheets number format tokens and the strptime directive for each, longer tokens first so "dddd" is not read as "d"
+# https://developers.google.com/sheets/api/guides/formats#date_and_time_format_patterns
+PATTERN_TOKENS = [
+    ("dddd", "%A"), ("ddd", "%a"), ("dd", "%d"), ("d", "%d"),
+    ("mmmm", "%B"), ("mmm", "%b"), ("mm", "%m"), ("m", "%m"),
+    ("yyyy", "%Y"), ("yy", "%y"),
+]
+
+# tried when the cell does not say what its format is, before falling back to dateutil
+COMMON_FORMATS = ["%A, %B %d, %Y", "%a, %b %d, %Y", "%m/%d/%Y", "%Y-%m-%d", "%A, %B %d", "%a %m/%d"]
+
+def serial_to_date(serial):
+    """Converts a sheets date serial number (days since 1899-12-30) to a date"""
+    return SERIAL_EPOCH + timedelta(days=int(serial))
+
+@lru_cache(maxsize=64)
+def pattern_to_strptime(pattern):
+    """
+    Converts a sheets date number format pattern like "dddd, mmmm d" to a strptime format like "%A, %B %d".
+    Returns None if the pattern has anything that is not a plain date (like times)
+    """
+    result = ""
+    index = 0
+
+    while index < len(pattern):
+        char = pattern[index]
+
+        if char == '"':
+            # quoted literal text
+            end = pattern.find('"', index + 1)
+            if end == -1:
+                return None
+            result += pattern[index + 1:end].replace("%", "%%")
+            index = end + 1
+            continue
+
+        if char == "\\" and index + 1 < len(pattern):
+            result += pattern[index + 1].replace("%", "%%")
+            index += 2
+            continue
+
+        for token, directive in PATTERN_TOKENS:
+            if pattern[index:index + len(token)].lower() == token:
+                result += directive
+                index += len(token)
+                break
+        else:
+            if char.isalpha():
+                # hours, seconds, am/pm and so on
+                return None
+            result += char.replace("%", "%%")
+            index += 1
+
+    return result
+
+@lru_cache(maxsize=4096)
+def parse_date_string(value, pattern=None):
+    """
+    Parses the formatted value of a date cell. Tries the cells own format pattern and then a few common formats with
+    strptime, and only uses the (much slower) dateutil parser for anything else. Results are cached since the same
+    dates show up over and over
+    """
+    strptime_format = pattern_to_strptime(pattern) if pattern else None
+    formats = [strptime_format] if strptime_format else []
+
+    for date_format in formats + COMMON_FORMATS:
+        try:
+            parsed = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+
+        # same as dateutil, dates without a year are in the current year
+        if "%Y" not in date_format and "%y" not in date_format:
+            parsed = parsed.replace(year=date.today().year)
+        return parsed.date()
+
+    from dateutil.parser import parse
+    return parse(value).date()
+
+def parse_cell_date(cell):
+    """
+    Returns the date in a DATE formatted cell from the sheets api, or None if the cell is empty.
+    Uses the cells raw serial number when there is one so no text has to be parsed at all
+    """
+    number_value = cell.get('effectiveValue', {}).get('numberValue')
+    if number_value is not None:
+        return serial_to_date(number_value)
+
+    value = cell.get('formattedValue', '')
+    if not value:
+        return None
+
+    pattern = cell.get('effectiveFormat', {}).get('numberFormat', {}).get('pattern')
+    return parse_date_string(value, pattern)
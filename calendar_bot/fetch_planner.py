@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from calendar_bot.sheets_client import get_spreadsheet, iter_grid_rows, rowcol_to_a1
+from calendar_bot.tracing import add_count, span
+
+# the properties of every tab and which of their rows are hidden. This is only metadata so it stays small
+# no matter how big the sheets get
+LAYOUT_FIELD_MASK = "sheets(properties(index,sheetId,title,gridProperties(rowCount,columnCount,frozenRowCount)),data.rowMetadata.hiddenByUser)"
+
+# every field of a cell that any of the consumers (calendar, config, hide rows) need. All the ranges of a request
+# share one field mask so this is the union of what they each need
+RANGE_FIELD_MASK = "sheets(properties.title,data(startRow,rowData.values(effectiveFormat(numberFormat,backgroundColor,textFormat.strikethrough),effectiveValue.numberValue,formattedValue)))"
+
+
+@dataclass
+class SheetLayout:
+    # properties of the tab as returned by the api
+    properties: dict
+    # whether each row of the tab is hidden
+    hidden_rows: List[bool]
+
+    @property
+    def sheet_id(self):
+        return self.properties['sheetId']
+
+    @property
+    def title(self):
+        return self.properties['title']
+
+    @property
+    def grid_properties(self):
+        return self.properties['gridProperties']
+
+    def get_range(self, start_row=None, end_row=None):
+        """
+        Returns the A1 range of rows [start_row, end_row) (0 based) of this tab. Without any rows it is the whole tab,
+        which the api understands without needing to know how big the tab is
+        """
+        quoted_title = "'" + self.title.replace("'", "''") + "'"
+        if start_row is None or end_row is None:
+            return quoted_title
+
+        return f"{quoted_title}!A{start_row + 1}:{rowcol_to_a1(end_row, self.grid_properties['columnCount'])}"
+
+
+class FetchPlanner:
+    """
+    Downloads everything a run needs from one spreadsheet in as few requests as possible. The layout of every tab
+    is downloaded once, and then every range that has been requested (by the calendar, config or hide rows) is
+    downloaded together in one request the first time any of them is needed.
+
+    A range can be requested with a parse_row function, then each row is parsed as soon as it is read from the
+    response and only the parsed rows are kept, never the whole response
+    """
+
+    def __init__(self, spreadsheet_id, api_key):
+        self.spreadsheet_id = spreadsheet_id
+        self.api_key = api_key
+        self._layouts = None
+        # ranges that have been requested but not downloaded yet, as (title, (range, parse_row))
+        self._pending = []
+        # (range, parse_row) -> list of rows from the api, parsed with parse_row if there is one
+        self._results: Dict[tuple, list] = {}
+
+    def get_layouts(self) -> List[SheetLayout]:
+        if self._layouts is None:
+            with span("sheets.layout"):
+                response = get_spreadsheet(self.spreadsheet_id, self.api_key, LAYOUT_FIELD_MASK, include_grid_data=True)
+
+            self._layouts = []
+            for sheet in response['sheets']:
+                data = sheet.get('data', [{}])
+                row_metadata = data[0].get('rowMetadata', []) if data else []
+                hidden_rows = [metadata.get('hiddenByUser', False) for metadata in row_metadata]
+                self._layouts.append(SheetLayout(sheet['properties'], hidden_rows))
+
+        return self._layouts
+
+    def get_default_sheet_layout(self) -> SheetLayout:
+        """Returns the layout of the first tab of the spreadsheet"""
+        for layout in self.get_layouts():
+            if layout.properties['index'] == 0:
+                return layout
+        raise Exception(f"Spreadsheet {self.spreadsheet_id} has no sheets")
+
+    def get_sheet_layout(self, gid) -> SheetLayout:
+        """Returns the layout of the tab with the given gid (sheet id)"""
+        for layout in self.get_layouts():
+            if str(layout.sheet_id) == str(gid):
+                return layout
+        raise Exception("Sheet GID not found: " + str(gid))
+
+    def request(self, layout: SheetLayout, sheet_range, parse_row: Callable = None):
+        """Adds the range to the next request, unless it has already been downloaded or requested"""
+        key = (sheet_range, parse_row)
+        if key not in self._results and all(pending_key != key for _, pending_key in self._pending):
+            self._pending.append((layout.title, key))
+
+    def get(self, layout: SheetLayout, sheet_range, parse_row: Callable = None):
+        """
+        Returns the rows of the given range, downloading it along with every other requested range if needed.
+        If parse_row is given the rows are returned already parsed with it
+        """
+        key = (sheet_range, parse_row)
+        if key not in self._results:
+            self.request(layout, sheet_range, parse_row)
+            self.fetch()
+        return self._results[key]
+
+    def fetch(self):
+        """Downloads every requested range in one request"""
+        if not self._pending:
+            return
+
+        pending = self._pending
+        self._pending = []
+
+        # the api returns each tab once with one entry in its data for each range of that tab, in the order requested
+        keys_by_title = {}
+        for title, key in pending:
+            keys_by_title.setdefault(title, []).append(key)
+        results = {key: [] for _, key in pending}
+
+        sheet_ranges = [sheet_range for _, (sheet_range, _) in pending]
+        num_rows = 0
+        num_cells = 0
+
+        with span("sheets.fetch", ranges=len(sheet_ranges)):
+            for title, grid_index, row in iter_grid_rows(self.spreadsheet_id, self.api_key, RANGE_FIELD_MASK, sheet_ranges):
+                key = keys_by_title[title][grid_index]
+                parse_row = key[1]
+                results[key].append(parse_row(row) if parse_row is not None else row)
+                num_rows += 1
+                num_cells += len(row.get('values', ()))
+
+            add_count("rows", num_rows)
+            add_count("cells", num_cells)
+
+        # only once everything downloaded so a failed request is not mistaken for empty ranges
+        self._results.update(results)
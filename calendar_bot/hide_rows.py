@@ -1,109 +1,62 @@
 import os
-import requests
-from dateutil.parser import parse
 from datetime import date
+from typing import List
 import logging
-import httplib2
 
-from apiclient import discovery
-from google.oauth2 import service_account
-
-from calendar_bot.calendar_bot import get_default_sheet, get_cell_is_date
+from calendar_bot.calendar_bot import get_cell_format, get_row_data, get_window_anchor_row, get_rows_around_dates
+from calendar_bot.fetch_planner import FetchPlanner
+from calendar_bot.dates import parse_cell_date
+from calendar_bot.tenants import Tenant, TenantErrors, get_tenants
+from calendar_bot.sheets_writer import RowVisibilityBatch
+from calendar_bot.tracing import span, trace_run
+from calendar_bot.calendar_grid import CalendarGrid, Cell, EMPTY_CELL, trim_blank_cells
 from calendar_bot.config import *
 
-## shamelessly stolen from gspread
-def rowcol_to_a1(row: int, col: int) -> str:
-    """Translates a row and column cell address to A1 notation.
-
-    :param row: The row of the cell to be converted.
-        Rows start at index 1.
-    :type row: int, str
-
-    :param col: The column of the cell to be converted.
-        Columns start at index 1.
-    :type row: int, str
-
-    :returns: a string containing the cell's coordinates in A1 notation.
-
-    Example:
-
-    >>> rowcol_to_a1(1, 1)
-    A1
-
+def get_sheet_data(api_key, sheet_id, today=None, planner: FetchPlanner = None):
     """
+    Returns the default sheet and a list of its rows, each with whether the row is hidden and its cells.
+    If today is given, only the cells of the rows around today are downloaded (see get_rows_around_dates).
+    Pass in a planner to share its requests with the other consumers of the spreadsheet
+    """
+    planner = planner if planner is not None else FetchPlanner(sheet_id, api_key)
+    layout = planner.get_default_sheet_layout()
 
-    div = col
-    column_label = ""
-
-    while div:
-        (div, mod) = divmod(div, 26)
-        if mod == 0:
-            mod = 26
-            div -= 1
-        column_label = chr(mod + 64) + column_label
-
-    label = "{}{}".format(column_label, row)
-
-    return label
-
-# returns the range of all the sheets values in A1 format
-def get_entire_sheet_range(num_rows, num_cols):
-    return f"A1:{rowcol_to_a1(num_rows, num_cols)}"
-
-def get_sheet_data(api_key, sheet_id):
-    base_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}"
-    key_param = f"key={api_key}"
-    # what fields to return from the api
-    field_mask = "fields=sheets.properties(index,sheetId,gridProperties(rowCount,columnCount,frozenRowCount))"
-    r = requests.get(f"{base_url}?{key_param}&{field_mask}")
-
-    sheets = r.json()['sheets']
-    default_sheet = get_default_sheet(sheets)
-
-    num_rows = default_sheet['properties']['gridProperties']['rowCount']
-    num_cols = default_sheet['properties']['gridProperties']['columnCount']
-
-    sheet_range = get_entire_sheet_range(num_rows, num_cols)
-
-    # what fields to return from the third api call
-    field_mask = "fields=sheets.data(rowMetadata.hiddenByUser,rowData.values(effectiveFormat(numberFormat,backgroundColor),formattedValue))"
-    r = requests.get(f"{base_url}?{key_param}&ranges={sheet_range}&{field_mask}")
-
-    response = r.json()
+    if today is None:
+        cells = planner.get(layout, layout.get_range(), parse_row)
+    else:
+        def get_rows(start_row, end_row):
+            return [parse_row(row) for row in get_row_data(planner, layout, start_row, end_row)]
 
-    row_data = response['sheets'][0]['data'][0]['rowData']
-    row_metadata = response['sheets'][0]['data'][0]['rowMetadata']
+        cells = get_rows_around_dates(get_rows, layout.grid_properties['rowCount'], get_window_anchor_row(layout), today, today)
 
     data = []
+    for index in range(max(len(layout.hidden_rows), len(cells))):
+        is_row_hidden = layout.hidden_rows[index] if index < len(layout.hidden_rows) else False
+        data.append({"hidden": is_row_hidden, "cells": cells[index] if index < len(cells) else []})
 
-    for index, row in enumerate(row_data):
-        is_row_hidden = row_metadata[index]['hiddenByUser'] if 'hiddenByUser' in row_metadata[index] else False
+    return {"properties": layout.properties}, data
 
-        new_row = {"hidden": is_row_hidden, "cells": []}
+def parse_row(row):
+    """Converts a row from the sheets api into a list of cells with any dates converted to date objects"""
+    cells = []
 
-        for cell in row['values']:
-            is_date = get_cell_is_date(cell)
-            value = cell['formattedValue'] if 'formattedValue' in cell else ''
-            # convert value to date if it is a date 
-            if is_date and value:
-                value = parse(value).date()
+    for cell in row.get('values', []):
+        _, is_date, _ = get_cell_format(cell)
+        value = cell['formattedValue'] if 'formattedValue' in cell else ''
+        # convert value to date if it is a date 
+        if is_date and value:
+            value = parse_cell_date(cell)
 
-            new_row['cells'].append({"is_date": is_date, "value": value})
+        cells.append(Cell(value, is_date=is_date) if value != '' else EMPTY_CELL)
 
-        data.append(new_row)
+    return trim_blank_cells(cells)
 
-    return default_sheet, data
-
-def get_date_location(date, data):
+def get_date_location(date, calendar: CalendarGrid):
     """
     Finds the row and column of the given date in the given cells using 0 based indexing
     Throws an error if the date is not found
     """
-    for row_idx, row in enumerate(data):
-        for col_idx, cell in enumerate(row['cells']):
-            if cell['value'] == date:
-                return row_idx, col_idx  # Return the first occurrence
-    raise ValueError(f"Date: {date} not found in the calendar")
+    return calendar.get_date_location(date)
 
 def get_first_non_hidden_row(data, frozen_row_count):
     for row_index, row in enumerate(data):
@@ -113,50 +66,49 @@ def get_first_non_hidden_row(data, frozen_row_count):
 
     return len(data)
 
-def do_hide_rows_api_call(credentials, spreadsheet_id, sheet_id, start_row, end_row):
+def hide_rows(today = date.today(), tenants: List[Tenant] = None):
     """
-    Hides the given range of rows [start_row, end_row) (inclusive on start, exclusive on end)
-    rows are specified using zero based indexing
+    Hides the old rows of every tenants calendar (see get_tenants). A tenant failing does not stop the others,
+    the errors are logged and raised together once every tenant is done
     """
-    service = discovery.build('sheets', 'v4', credentials=credentials)
-
-    body = {
-        "requests": [{
-            "updateDimensionProperties": {
-                "properties": {
-                    "hiddenByUser": True
-                },
-                "fields": "hiddenByUser",
-                "range": {
-                    "sheetId": sheet_id,
-                    "dimension": "ROWS",
-                    "startIndex": start_row,
-                    "endIndex": end_row,
-                }
-            }
-        }],
-        "includeSpreadsheetInResponse": False,
-    }
-
-    r = service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body=body
-    ).execute()
-
-    logging.info(r)
-
-def hide_rows(today = date.today()):
+    tenants = tenants if tenants is not None else get_tenants()
+
+    with trace_run("hide_rows", today=today.isoformat(), tenants=len(tenants)):
+        _hide_rows(today, tenants)
+
+def _hide_rows(today: date, tenants: List[Tenant]):
+    errors = TenantErrors("Hiding rows", len(tenants))
+
+    # the rows to hide are collected for every tenant first and then hidden with one request per spreadsheet
+    batch = RowVisibilityBatch()
+
+    for tenant in tenants:
+        try:
+            with span("tenant", tenant=tenant.name):
+                hide_tenant_rows(tenant, today, batch)
+        except Exception as e:
+            errors.add(tenant.name, e)
+
+    with span("flush"):
+        batch.flush()
+
+    errors.raise_if_any()
+
+def hide_tenant_rows(tenant: Tenant, today: date, batch: RowVisibilityBatch):
     """
-    Hides all rows up until (but not including) the row containing the given date
+    Adds hiding all rows up until (but not including) the row containing the given date to the batch
     Does not hide frozen (pinned) rows
     """
 
     google_api_key = os.getenv('google_api_key')
 
-    default_sheet, data = get_sheet_data(google_api_key, SHEET_ID)
+    with span("get_sheet_data"):
+        default_sheet, data = get_sheet_data(google_api_key, tenant.sheet_id, today)
+
+    calendar = CalendarGrid([row['cells'] for row in data])
 
     # get the index of the row containing todays date
-    today_row_index, _ = get_date_location(today, data)
+    today_row_index, _ = get_date_location(today, calendar)
 
     
     frozen_row_count = default_sheet['properties']['gridProperties']['frozenRowCount']
@@ -165,16 +117,10 @@ def hide_rows(today = date.today()):
 
     # hid all nonforzen rows up until the row before todays date
     if (first_non_hidden_row_index < today_row_index):
-        logging.info(f"hiding rows {first_non_hidden_row_index} to {today_row_index}")
-        scopes = ["https://www.googleapis.com/auth/drive", "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/spreadsheets"]
-        google_service_account_private_key = json.loads(os.getenv('google_service_account'))
-
-        # have to use a service account credentials (2 legged oauth) to make modifications
-        # to a sheet instead of just using an api key
-        credentials = service_account.Credentials.from_service_account_info(google_service_account_private_key, scopes=scopes)
+        logging.info(f"hiding rows {first_non_hidden_row_index} to {today_row_index} for {tenant.name}")
 
         default_sheet_id = default_sheet['properties']['sheetId']
-        # SHEET_ID is technically the spreadsheet id, and default_sheet_id is the actual sheet id to modify
-        do_hide_rows_api_call(credentials, SHEET_ID, default_sheet_id, first_non_hidden_row_index, today_row_index)
+        # tenant.sheet_id is technically the spreadsheet id, and default_sheet_id is the actual sheet id to modify
+        batch.set_rows_hidden(tenant.sheet_id, default_sheet_id, first_non_hidden_row_index, today_row_index)
     else:
         logging.info("no rows to hide")
\ No newline at end of file
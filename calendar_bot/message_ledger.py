@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import time
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Optional
+
+from calendar_bot.sqlite_store import SqliteStore, get_store
+
+# how long sent messages are remembered after their shift
+LEDGER_RETENTION_DAYS = 30
+
+# what to do when a message about a shift changed since it was sent. "post" sends a new message, "edit" replaces
+# the sent message with chat.update, "off" turns the ledger off and every message is always sent
+LEDGER_MODES = ("post", "edit", "off")
+
+
+@dataclass
+class LedgerEntry:
+    content_hash: str
+    # the channel id (not name) and ts slack returned for the message, needed to edit it
+    channel_id: str
+    ts: str
+
+
+def get_ledger_mode():
+    mode = os.getenv('message_ledger_mode', "post")
+    if mode not in LEDGER_MODES:
+        raise Exception(f"message_ledger_mode must be one of {', '.join(LEDGER_MODES)}, not {mode}")
+    return mode
+
+def get_config_key(message_type, config):
+    """Identifies a message config (of the given type) by everything about it"""
+    return message_type + ":" + hashlib.blake2b(json.dumps(asdict(config), sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+
+def get_content_hash(channel, message):
+    return hashlib.blake2b(json.dumps([channel, message], sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class MessageLedger(SqliteStore):
+    """
+    Remembers the last message sent for each (tenant, message config, shift date) and a hash of its content, so
+    running the bot again (a retry, the http trigger, a change alert) does not post the same message twice.
+    Stored in a sqlite database like the snapshot store
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            tenant TEXT, config_key TEXT, shift_date TEXT, content_hash TEXT, channel_id TEXT, ts TEXT, sent_at REAL,
+            PRIMARY KEY (tenant, config_key, shift_date)
+        );
+    """
+
+    def get(self, tenant_name, config_key, shift_date: date) -> Optional[LedgerEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content_hash, channel_id, ts FROM messages WHERE tenant = ? AND config_key = ? AND shift_date = ?",
+                (tenant_name, config_key, shift_date.isoformat())
+            ).fetchone()
+        return LedgerEntry(*row) if row else None
+
+    def record(self, tenant_name, config_key, shift_date: date, content_hash, channel_id, ts):
+        """Saves that the message was sent, called once slack accepted it"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tenant_name, config_key, shift_date.isoformat(), content_hash, channel_id, ts, time.time())
+            )
+
+    def prune(self, before_date: date):
+        """Forgets the messages about shifts before the given date"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages WHERE shift_date < ?", (before_date.isoformat(),))
+
+
+def get_message_ledger(path=None) -> MessageLedger:
+    """Returns the message ledger for the process (one per path)"""
+    return get_store(MessageLedger, 'message_ledger_path', "calendar_bot_messages.sqlite3", path)
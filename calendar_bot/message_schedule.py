@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List
+
+from calendar_bot.config import DAYS_OF_WEEK, Config, MessageConfig
+from calendar_bot.shifts import Shift
+
+# the message types of a config, in the order their messages are sent
+MESSAGE_TYPES = ["shift_warning", "shift_notes", "bike_school_reminder"]
+
+
+@dataclass
+class ScheduledMessage:
+    """A message config that looks at the shift on shift_date when the bot runs on send_date"""
+    send_date: date
+    message_type: str
+    config: MessageConfig
+    shift_date: date
+
+    @property
+    def day_of_week(self):
+        return DAYS_OF_WEEK[self.shift_date.weekday()]
+
+
+def get_should_send(scheduled_message: ScheduledMessage, shift: Shift):
+    """Whether the scheduled message is sent for the shift as it is now"""
+    if scheduled_message.message_type == "shift_warning":
+        return shift.needs_warning(scheduled_message.config)
+    if scheduled_message.message_type == "shift_notes":
+        return bool(shift.special_notes)
+    if scheduled_message.message_type == "bike_school_reminder":
+        return shift.is_bike_school(scheduled_message.config)
+    raise Exception(f"Unknown message type {scheduled_message.message_type}")
+
+
+class MessageSchedule:
+    """
+    Every message config of a Config that is due on each day between start_date and end_date (inclusive), built
+    once up front. A config only looks at shifts on its days, so on most days most configs have nothing to do and
+    are never looked at. Also answers what the bot will look at over the coming days (get_between)
+    """
+
+    def __init__(self, config: Config, start_date: date, end_date: date):
+        self.start_date = start_date
+        self.end_date = end_date
+        # send date -> the messages due that day, in the order they are sent
+        self._messages: Dict[date, List[ScheduledMessage]] = {}
+
+        for message_type in MESSAGE_TYPES:
+            for message_config in getattr(config, message_type):
+                for scheduled_message in get_scheduled_messages(message_type, message_config, start_date, end_date):
+                    self._messages.setdefault(scheduled_message.send_date, []).append(scheduled_message)
+
+    def get_due(self, send_date: date) -> List[ScheduledMessage]:
+        """The messages due on the given day"""
+        if send_date < self.start_date or send_date > self.end_date:
+            raise ValueError(f"{send_date} is not between {self.start_date} and {self.end_date}")
+
+        return self._messages.get(send_date, [])
+
+    def get_between(self, start_date: date, end_date: date) -> List[ScheduledMessage]:
+        """The messages due between start_date and end_date (inclusive), by day"""
+        messages = []
+        for day in range((end_date - start_date).days + 1):
+            messages.extend(self.get_due(start_date + timedelta(days=day)))
+        return messages
+
+def get_scheduled_messages(message_type, message_config: MessageConfig, start_date: date, end_date: date):
+    """Yields every time the config is due between start_date and end_date, jumping a week at a time per shift day"""
+    days_before = timedelta(days=message_config.days_before)
+    first_shift_date = start_date + days_before
+    last_shift_date = end_date + days_before
+
+    # only the days the config has, and the same day listed twice still only sends once
+    for weekday in sorted({DAYS_OF_WEEK.index(day) for day in message_config.days if day in DAYS_OF_WEEK}):
+        shift_date = first_shift_date + timedelta(days=(weekday - first_shift_date.weekday()) % 7)
+        while shift_date <= last_shift_date:
+            yield ScheduledMessage(shift_date - days_before, message_type, message_config, shift_date)
+            shift_date += timedelta(days=7)
@@ -0,0 +1,139 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from calendar_bot.sqlite_store import SqliteStore, get_store
+
+
+@dataclass
+class Poll:
+    """
+    The state of a poll, the rendered message is built from this (see slack_poll.render_poll) instead of the
+    other way around. Voters are kept as ordered sets (dicts) so adding or removing a vote is O(1) and voters are
+    still listed in the order they voted
+    """
+    # slack timestamp of the poll message, unique within its channel
+    ts: str
+    # the blocks above the options (the question), kept as they were sent
+    header_blocks: list
+    # text of each option
+    options: List[str]
+    # user ids who picked each option, in the order they picked it
+    voters: List[Dict[str, None]] = field(default_factory=list)
+    # user id -> how many options they picked, so the number of respondents does not need every option checked
+    respondents: Dict[str, int] = field(default_factory=dict)
+    # bumped on every vote, used to tell if another instance changed the poll
+    version: int = 0
+
+    def __post_init__(self):
+        if not self.voters:
+            self.voters = [{} for _ in self.options]
+
+    def toggle_vote(self, user_id, option_index) -> bool:
+        """Adds the users vote for the option, or removes it if they already picked it. Returns if it was added"""
+        if option_index < 0 or option_index >= len(self.options):
+            raise Exception(f"Poll {self.ts} has no option {option_index}")
+
+        option_voters = self.voters[option_index]
+
+        if user_id in option_voters:
+            del option_voters[user_id]
+            self.respondents[user_id] -= 1
+            if self.respondents[user_id] == 0:
+                del self.respondents[user_id]
+            return False
+
+        option_voters[user_id] = None
+        self.respondents[user_id] = self.respondents.get(user_id, 0) + 1
+        return True
+
+    def add_vote(self, user_id, option_index):
+        """Adds a vote without toggling, for loading a poll"""
+        if user_id not in self.voters[option_index]:
+            self.toggle_vote(user_id, option_index)
+
+    @property
+    def num_respondents(self):
+        return len(self.respondents)
+
+
+class PollStore(SqliteStore):
+    """
+    Keeps the state of every poll in a sqlite database keyed by the message ts, and the polls that have been used
+    in memory so a vote only has to change one row. Stands in for a shared store, the database can be on a
+    mounted file share so every instance sees the same votes
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS polls (
+            ts TEXT PRIMARY KEY, header_blocks TEXT, options TEXT, version INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS votes (
+            ts TEXT, option_index INTEGER, user_id TEXT,
+            PRIMARY KEY (ts, option_index, user_id)
+        );
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        # ts -> poll
+        self._polls: Dict[str, Poll] = {}
+
+    def get_poll(self, ts) -> Optional[Poll]:
+        """Returns the poll with the given ts, None if it has never been saved"""
+        with self._lock:
+            return self._get_poll(ts)
+
+    def _get_poll(self, ts):
+        row = self._connection.execute("SELECT header_blocks, options, version FROM polls WHERE ts = ?", (ts,)).fetchone()
+        if row is None:
+            self._polls.pop(ts, None)
+            return None
+
+        header_blocks, options, version = row
+        poll = self._polls.get(ts)
+
+        # only load the votes again if they were changed by someone else (like another instance)
+        if poll is None or poll.version != version:
+            poll = Poll(ts, json.loads(header_blocks), json.loads(options), version=version)
+            # rowid is the order the votes were added in
+            votes = self._connection.execute("SELECT option_index, user_id FROM votes WHERE ts = ? ORDER BY rowid", (ts,)).fetchall()
+            for option_index, user_id in votes:
+                poll.add_vote(user_id, option_index)
+            self._polls[ts] = poll
+
+        return poll
+
+    def add_poll(self, poll: Poll):
+        """Saves a new poll along with any votes it already has, replacing any poll with the same ts"""
+        votes = [(poll.ts, option_index, user_id) for option_index, option_voters in enumerate(poll.voters) for user_id in option_voters]
+
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO polls VALUES (?, ?, ?, ?)", (poll.ts, json.dumps(poll.header_blocks), json.dumps(poll.options), poll.version))
+            self._connection.execute("DELETE FROM votes WHERE ts = ?", (poll.ts,))
+            self._connection.executemany("INSERT INTO votes VALUES (?, ?, ?)", votes)
+            self._polls[poll.ts] = poll
+
+    def toggle_vote(self, ts, user_id, option_index) -> Poll:
+        """Adds or removes the users vote for the option (see Poll.toggle_vote) and returns the updated poll"""
+        with self._lock, self._connection:
+            # takes the write lock before reading so no other instance can vote in between
+            self._connection.execute("BEGIN IMMEDIATE")
+            poll = self._get_poll(ts)
+            if poll is None:
+                raise Exception(f"Poll {ts} not found")
+
+            if poll.toggle_vote(user_id, option_index):
+                self._connection.execute("INSERT INTO votes VALUES (?, ?, ?)", (ts, option_index, user_id))
+            else:
+                self._connection.execute("DELETE FROM votes WHERE ts = ? AND option_index = ? AND user_id = ?", (ts, option_index, user_id))
+
+            poll.version += 1
+            self._connection.execute("UPDATE polls SET version = ? WHERE ts = ?", (poll.version, ts))
+
+            return poll
+
+
+def get_poll_store(path=None) -> PollStore:
+    """Returns the poll store for the process (one per path)"""
+    return get_store(PollStore, 'poll_store_path', "calendar_bot_polls.sqlite3", path)
@@ -0,0 +1,200 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from calendar_bot.tracing import add_response
+
+# optional, without it responses are parsed all at once with r.json()
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# can be pointed somewhere else (like the fake servers in benchmarks/) with the sheets_api_root and
+# drive_api_root settings
+SHEETS_API_ROOT = "https://sheets.googleapis.com/"
+DRIVE_API_ROOT = "https://www.googleapis.com/"
+
+# seconds to wait for a connection to google and then for google to respond
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# rate limited (429) and server errors (5xx) are retried with exponential backoff plus some random jitter
+# (0.5s, 1s, 2s, 4s ...) and respect the Retry-After header if google sends one
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.5
+BACKOFF_JITTER = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+## shamelessly stolen from gspread
+def rowcol_to_a1(row: int, col: int) -> str:
+    """Translates a row and column cell address to A1 notation.
+
+    :param row: The row of the cell to be converted.
+        Rows start at index 1.
+    :type row: int, str
+
+    :param col: The column of the cell to be converted.
+        Columns start at index 1.
+    :type row: int, str
+
+    :returns: a string containing the cell's coordinates in A1 notation.
+
+    Example:
+
+    >>> rowcol_to_a1(1, 1)
+    A1
+
+    """
+
+    div = col
+    column_label = ""
+
+    while div:
+        (div, mod) = divmod(div, 26)
+        if mod == 0:
+            mod = 26
+            div -= 1
+        column_label = chr(mod + 64) + column_label
+
+    label = "{}{}".format(column_label, row)
+
+    return label
+
+def get_sheets_api_url():
+    return os.getenv('sheets_api_root', SHEETS_API_ROOT).rstrip("/") + "/v4/spreadsheets"
+
+def get_drive_api_url():
+    return os.getenv('drive_api_root', DRIVE_API_ROOT).rstrip("/") + "/drive/v3/files"
+
+# one session for the whole process so every call to the sheets api reuses the same pooled connections
+# instead of doing a new TLS handshake each time. Tenants are fetched on several threads, the lock makes sure they
+# all get the same session
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                backoff_jitter=BACKOFF_JITTER,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset(["GET"]),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # google only gzips responses if both the Accept-Encoding and User-Agent headers ask for it
+            session.headers.update({"Accept-Encoding": "gzip", "User-Agent": "816CalendarBot (gzip)"})
+
+            _session = session
+        return _session
+
+def get_spreadsheet(sheet_id, api_key, fields, ranges=None, include_grid_data=False):
+    """
+    Calls spreadsheets.get for the given spreadsheet and returns the parsed json response.
+    fields is the field mask of what to return, ranges is an A1 range (or list of them) to limit the grid data to.
+    Throws an error if the request still fails after retrying
+    """
+    params = {"key": api_key, "fields": fields}
+    if ranges is not None:
+        params["ranges"] = ranges
+    if include_grid_data:
+        params["includeGridData"] = "true"
+
+    r = _get_spreadsheet_response(sheet_id, params)
+    response = r.json()
+    add_response(r)
+    return response
+
+def _get_spreadsheet_response(sheet_id, params, stream=False):
+    r = get_session().get(f"{get_sheets_api_url()}/{sheet_id}", params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=stream)
+
+    if r.status_code != 200:
+        logging.error(f"Sheets api request for {sheet_id} failed with status {r.status_code}: {r.text[:500]}")
+        r.close()
+    r.raise_for_status()
+
+    return r
+
+# json paths (in ijson prefix form) of the parts of a spreadsheets.get response that iter_grid_rows cares about
+_SHEET_PREFIX = "sheets.item"
+_TITLE_PREFIX = "sheets.item.properties.title"
+_GRID_DATA_PREFIX = "sheets.item.data.item"
+_ROW_PREFIX = "sheets.item.data.item.rowData.item"
+
+def iter_grid_rows(sheet_id, api_key, fields, ranges):
+    """
+    Calls spreadsheets.get for the given ranges and yields (title, grid_index, row) for every row of grid data in the
+    response, grid_index being which of that tabs ranges (in the order they were requested) the row is in.
+
+    With ijson installed the response is parsed as it is downloaded, so only the row being yielded is ever in memory
+    instead of the whole response. Without it the whole response is parsed first like get_spreadsheet
+    """
+    params = {"key": api_key, "fields": fields, "ranges": ranges}
+
+    if ijson is None:
+        r = _get_spreadsheet_response(sheet_id, params)
+        response = r.json()
+        add_response(r)
+        for sheet in response.get('sheets', []):
+            for grid_index, grid_data in enumerate(sheet.get('data', [])):
+                for row in grid_data.get('rowData', []):
+                    yield sheet['properties']['title'], grid_index, row
+        return
+
+    r = _get_spreadsheet_response(sheet_id, params, stream=True)
+    try:
+        # let urllib3 undo the gzip encoding while streaming
+        r.raw.decode_content = True
+
+        # where in the response the parser currently is, updated as the events go by
+        position = {"title": None, "grid_index": -1}
+
+        def track_position(events):
+            for prefix, event, value in events:
+                if prefix == _SHEET_PREFIX and event == 'start_map':
+                    position["title"] = None
+                    position["grid_index"] = -1
+                elif prefix == _TITLE_PREFIX:
+                    position["title"] = value
+                elif prefix == _GRID_DATA_PREFIX and event == 'start_map':
+                    position["grid_index"] += 1
+                yield prefix, event, value
+
+        # ijson builds each row (in C with the yajl backend) and yields it as soon as the end of it has been read.
+        # Floats instead of Decimals so rows are the same as what r.json() would give
+        events = track_position(ijson.parse(r.raw, use_float=True))
+        for row in ijson.items(events, _ROW_PREFIX):
+            yield position["title"], position["grid_index"], row
+    finally:
+        add_response(r)
+        r.close()
+
+def get_modified_time(file_id, api_key):
+    """
+    Returns when the spreadsheet was last modified (an RFC 3339 string) using the drive api, which is much cheaper
+    than downloading the sheet. Returns None if it can not be found out, like if the drive api is not enabled for the key
+    """
+    try:
+        r = get_session().get(f"{get_drive_api_url()}/{file_id}", params={"key": api_key, "fields": "modifiedTime"}, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except requests.RequestException as e:
+        logging.warning(f"Could not get modified time of {file_id}: {e}")
+        return None
+
+    add_response(r)
+    if r.status_code != 200:
+        logging.warning(f"Could not get modified time of {file_id}, status {r.status_code}: {r.text[:500]}")
+        return None
+
+    return r.json().get('modifiedTime')
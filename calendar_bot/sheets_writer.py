@@ -0,0 +1,123 @@
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from calendar_bot.tracing import span
+
+# have to use a service account credentials (2 legged oauth) to make modifications
+# to a sheet instead of just using an api key
+SCOPES = ["https://www.googleapis.com/auth/drive", "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/spreadsheets"]
+
+# the credentials and the service built with them are kept for the life of the process. The credentials refresh
+# their access token themselves when it expires, the service is only built once
+_credentials = None
+_service = None
+_drive_service = None
+_lock = threading.Lock()
+
+def get_credentials():
+    """Returns the service account credentials from the google_service_account setting"""
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            # the google client libraries are slow to import and only needed when a sheet is changed
+            from google.oauth2 import service_account
+
+            google_service_account_private_key = json.loads(os.getenv('google_service_account'))
+            _credentials = service_account.Credentials.from_service_account_info(google_service_account_private_key, scopes=SCOPES)
+        return _credentials
+
+def get_sheets_service():
+    """
+    Returns the sheets api client for making changes to spreadsheets. Uses the discovery document that ships with
+    the client library instead of downloading it, and does not try to cache it to disk (which only logs warnings)
+    """
+    global _service
+    credentials = get_credentials()
+    with _lock:
+        if _service is None:
+            from googleapiclient import discovery
+            # same setting as the sheets api calls in sheets_client
+            api_root = os.getenv('sheets_api_root')
+            client_options = {"api_endpoint": api_root} if api_root else None
+            _service = discovery.build('sheets', 'v4', credentials=credentials, static_discovery=True, cache_discovery=False, client_options=client_options)
+        return _service
+
+def get_drive_service():
+    """Returns the drive api client, used to watch spreadsheets for changes"""
+    global _drive_service
+    credentials = get_credentials()
+    with _lock:
+        if _drive_service is None:
+            from googleapiclient import discovery
+            api_root = os.getenv('drive_api_root')
+            client_options = {"api_endpoint": api_root} if api_root else None
+            _drive_service = discovery.build('drive', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False, client_options=client_options)
+        return _drive_service
+
+
+@dataclass
+class RowVisibilityBatch:
+    """
+    Collects row visibility changes for any number of spreadsheets and tabs, and sends all of the changes to each
+    spreadsheet in a single batchUpdate. The api can not change more than one spreadsheet per request
+    """
+    # spreadsheet id -> updateDimensionProperties requests for it, in the order they were added
+    requests: Dict[str, List[dict]] = field(default_factory=dict)
+
+    def set_rows_hidden(self, spreadsheet_id, sheet_id, start_row, end_row, hidden=True):
+        """
+        Hides (or shows) the given range of rows [start_row, end_row) (inclusive on start, exclusive on end) of the
+        tab with the given sheet id, rows are specified using zero based indexing
+        """
+        self.requests.setdefault(spreadsheet_id, []).append({
+            "updateDimensionProperties": {
+                "properties": {
+                    "hiddenByUser": hidden
+                },
+                "fields": "hiddenByUser",
+                "range": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "startIndex": start_row,
+                    "endIndex": end_row,
+                }
+            }
+        })
+
+    def flush(self):
+        """
+        Sends the changes, one batchUpdate per spreadsheet. A spreadsheet failing does not stop the others, the
+        errors are raised together once every spreadsheet has been tried
+        """
+        requests = self.requests
+        self.requests = {}
+
+        if not requests:
+            return
+
+        service = get_sheets_service()
+        errors = {}
+
+        for spreadsheet_id, spreadsheet_requests in requests.items():
+            body = {
+                "requests": spreadsheet_requests,
+                "includeSpreadsheetInResponse": False,
+            }
+
+            try:
+                with span("sheets.batch_update", requests=len(spreadsheet_requests)):
+                    r = service.spreadsheets().batchUpdate(
+                        spreadsheetId=spreadsheet_id,
+                        body=body
+                    ).execute()
+                logging.info(r)
+            except Exception as e:
+                logging.exception(f"Changing row visibility of {spreadsheet_id} failed")
+                errors[spreadsheet_id] = e
+
+        if errors:
+            raise Exception(f"Changing row visibility failed for {len(errors)} of {len(requests)} spreadsheets: {', '.join(errors)}") from next(iter(errors.values()))
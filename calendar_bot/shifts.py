@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List
+
+from calendar_bot.calendar_grid import CalendarGrid, get_lowest_set_bit, iter_set_bits
+from calendar_bot.config import MessageConfig
+
+
+@dataclass
+class Shift:
+    date: date
+    # volunteers signed up for the shift (not including striked through names)
+    volunteers: List[str]
+    # non gray cells under the date, like notes about new volunteers or bike school
+    special_notes: List[str]
+
+    def has_keyholder(self, config: MessageConfig):
+        """checks if any of the volunteers marked themselves as a keyholder with one of the configs keyholder marks"""
+        return get_has_keyholder(self.volunteers, config)
+
+    def needs_warning(self, config: MessageConfig):
+        """checks if the shift has fewer volunteers than the configs threshold or no keyholder"""
+        return len(self.volunteers) < config.volunteer_threshold or not self.has_keyholder(config)
+
+    def is_bike_school(self, config: MessageConfig):
+        """checks if any of the special notes contains any of the configs bike school marks"""
+        return is_bike_school(self.special_notes, config)
+
+
+def get_has_keyholder(volunteers, config: MessageConfig):
+    return any(keyholder_mark in volunteer.lower() for keyholder_mark in config.keyholder_marks for volunteer in volunteers)
+
+def is_bike_school(special_cells, config: MessageConfig):
+    """checks if any of the given special cells contains any of the marks of a bike school event"""
+    lower_special_cells = set([cell.lower() for cell in special_cells])
+    lower_school_marks = [mark.lower() for mark in config.bikeschool_marks]
+
+    for cell in lower_special_cells:
+        for mark in lower_school_marks:
+            if mark in cell:
+                return True
+    return False
+
+def extract_shift(calendar: CalendarGrid, shift_date, row, col):
+    """
+    Builds the shift for the date at the given row and column from every cell under it in the column until
+    the next date (or the end of the sheet) is reached
+    """
+    date_mask, special_mask, volunteer_mask = calendar.get_column_masks(col)
+
+    # find the next date under this one, the shift is every row in between
+    first_row = row + 1
+    rows_until_next_date = get_lowest_set_bit(date_mask >> first_row)
+    if rows_until_next_date == -1:
+        rows_until_next_date = max(calendar.num_rows - first_row, 0)
+    shift_rows = (1 << rows_until_next_date) - 1
+
+    # only the rows of the shift, shifted down so bit 0 is the row under the date
+    special_rows = [calendar.get_cell(first_row + offset, col).value for offset in iter_set_bits((special_mask >> first_row) & shift_rows)]
+
+    # get volunteers names. The cell may contain multiple volunteers sigining up separated
+    # by commas so split by commas and then remove any leading/trailing whitespace before
+    # adding the volunteers to the volunteers list
+    all_volunteers = []
+    for offset in iter_set_bits((volunteer_mask >> first_row) & shift_rows):
+        all_volunteers.extend(item.strip() for item in calendar.get_cell(first_row + offset, col).value.split(","))
+
+    # remove any possibly blank cells
+    all_volunteers = [volunteer for volunteer in all_volunteers if volunteer.strip() not in (None, '')]
+    special_rows = [special_row for special_row in special_rows if special_row.strip() not in (None, '')]
+
+    return Shift(shift_date, all_volunteers, special_rows)
+
+
+class ShiftTable:
+    """
+    Every shift in the calendar keyed by date. Each shift is parsed exactly once when the table is built
+    so every message type that asks about the same date reuses the same volunteers and notes
+    """
+
+    def __init__(self, calendar: CalendarGrid):
+        self.calendar = calendar
+        self._shifts: Dict[date, Shift] = {}
+
+        # each date is the top of its own block of cells so every cell under a date is only visited once
+        for shift_date in calendar.get_dates():
+            row, col = calendar.get_date_location(shift_date)
+            self._shifts[shift_date] = extract_shift(calendar, shift_date, row, col)
+
+    def get_shift(self, shift_date) -> Shift:
+        """Returns the shift on the given date. Throws an error if the date is not in the calendar"""
+        try:
+            return self._shifts[shift_date]
+        except KeyError:
+            raise ValueError(f"Date: {shift_date} not found in the calendar")
+
+    def get_shifts_between(self, start_date, end_date) -> List[Shift]:
+        """Returns every shift between start_date and end_date (inclusive on both ends) in order"""
+        return [self._shifts[shift_date] for shift_date in self.calendar.get_dates_between(start_date, end_date)]
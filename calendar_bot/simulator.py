@@ -0,0 +1,111 @@
+"""
+Replays the bot over a range of days without sending anything. The calendar and config are downloaded once, then
+every day in the range goes through the same decisions as a real run (which configs are due, which shifts need a
+message, the message text) and the messages are collected instead of being sent to slack
+"""
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from typing import List
+
+from calendar_bot.calendar_bot import MESSAGE_SENDERS, get_sheet_data, get_last_message_date, convert_dates
+from calendar_bot.calendar_grid import CalendarGrid
+from calendar_bot.config import get_config
+from calendar_bot.fetch_planner import FetchPlanner
+from calendar_bot.message_schedule import MessageSchedule, get_should_send
+from calendar_bot.shifts import ShiftTable
+from calendar_bot.tenants import Tenant, get_tenants
+
+# the days are independent of each other once everything is downloaded
+MAX_CONCURRENT_DAYS = 4
+
+
+@dataclass
+class SimulatedMessage:
+    send_date: date
+    message_type: str
+    channel: str
+    shift_date: date
+    message: str
+
+    def to_dict(self):
+        return {
+            "send_date": self.send_date.isoformat(),
+            "message_type": self.message_type,
+            "channel": self.channel,
+            "shift_date": self.shift_date.isoformat(),
+            "message": self.message,
+        }
+
+
+class MessageSink:
+    """Collects the messages of a simulation from any number of threads"""
+
+    def __init__(self):
+        self.messages: List[SimulatedMessage] = []
+        self._lock = threading.Lock()
+
+    def add(self, message: SimulatedMessage):
+        with self._lock:
+            self.messages.append(message)
+
+    def get_sorted_messages(self) -> List[SimulatedMessage]:
+        """The messages in the order a real run would have sent them, day by day"""
+        with self._lock:
+            # sorted is stable so the messages of a day keep the order they were sent in
+            return sorted(self.messages, key=lambda message: message.send_date)
+
+    def write_jsonl(self, file):
+        for message in self.get_sorted_messages():
+            file.write(json.dumps(message.to_dict(), ensure_ascii=False) + "\n")
+
+
+def simulate(start_date: date, end_date: date, tenant: Tenant = None, sink: MessageSink = None, max_workers=MAX_CONCURRENT_DAYS) -> MessageSink:
+    """
+    Runs the message decisions for every day from start_date to end_date (inclusive) as if the calendar stayed the
+    way it is now and returns the sink with every message that would have been sent. Only the downloads of the
+    calendar and config talk to google, nothing talks to slack
+    """
+    tenant = tenant if tenant is not None else get_tenants()[0]
+    sink = sink if sink is not None else MessageSink()
+
+    google_api_key = os.getenv('google_api_key')
+    planner = FetchPlanner(tenant.sheet_id, google_api_key)
+    # a broken config sheet is only logged, nothing is sent to its error channel
+    config_tenant = replace(tenant, message_sink=lambda channel, message: logging.warning(f"Would send to {channel}: {message}"))
+    config = get_config(planner, config_tenant)
+
+    # every shift any day of the simulation looks at, downloaded and parsed once
+    all_cells = get_sheet_data(google_api_key, tenant.sheet_id, start_date, get_last_message_date(config, end_date), planner)
+    convert_dates(all_cells)
+    shifts = ShiftTable(CalendarGrid(all_cells))
+
+    schedule = MessageSchedule(config, start_date, end_date)
+
+    def simulate_day(day):
+        for scheduled_message in schedule.get_due(day):
+            try:
+                shift = shifts.get_shift(scheduled_message.shift_date)
+            except ValueError:
+                logging.warning(f"{scheduled_message.shift_date} is not in the calendar, skipping the {scheduled_message.message_type} message for it on {day}")
+                continue
+
+            if not get_should_send(scheduled_message, shift):
+                continue
+
+            def message_sink(channel, message):
+                sink.add(SimulatedMessage(day, scheduled_message.message_type, channel, scheduled_message.shift_date, message))
+
+            day_tenant = replace(tenant, message_sink=message_sink)
+            MESSAGE_SENDERS[scheduled_message.message_type](scheduled_message.config, scheduled_message.day_of_week, shift, day_tenant, day)
+
+    days = [start_date + timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() so an error on any day is raised here
+        list(executor.map(simulate_day, days))
+
+    return sink
@@ -1,44 +1,15 @@
-import os
 import logging
-import time
 
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 from datetime import datetime, date
 
 from calendar_bot.config import * # yeah this is kinda awful but I don't feel like improving it with a real config file
+from calendar_bot.slack_client import send_message
+from calendar_bot.message_ledger import get_ledger_mode, get_message_ledger, get_config_key, get_content_hash
+from calendar_bot.tenants import Tenant
 
-def _send_message_internal(channel_id, message, use_blocks, fallback_text):
-    slack_token = os.getenv('slack_token')
-    client = WebClient(token=slack_token)
-
-    if use_blocks:
-        return client.chat_postMessage(
-            channel=channel_id,
-            text=fallback_text,
-            blocks=message
-        )
-    
-    return client.chat_postMessage(
-        channel=channel_id,
-        text=message,
-    )
-
-def send_message(channel_id, message, use_blocks=False, fallback_text=None):
-    """Send the given message to the specified channel and respect rate limits"""
-    try:
-        # Sending a message to the specified Slack channel
-        _send_message_internal(channel_id, message, use_blocks, fallback_text)
-        logging.info(f"Message sent successfully")
-    except SlackApiError as e:
-        if e.response.status_code == 429:
-            # The `Retry-After` header will tell you how long to wait before retrying
-            delay = int(e.response.headers['Retry-After'])
-            print(f"Rate limited. Retrying in {delay} seconds")
-            time.sleep(delay)
-            _send_message_internal(channel_id, message, use_blocks, fallback_text)
-        else:
-            logging.error(f"Error sending message: {e}")
+# the message type of warnings sent as soon as a shift stops being covered (see change_alerts.py). They are not
+# in the message ledger, so they never edit or get deduplicated against the scheduled warnings or each other
+CHANGE_ALERT = "change_alert"
 
 def get_volunteer_list(volunteers):
     """Get a comma separated list of volunteers where the last volunteers are separated by ', and'"""
@@ -58,11 +29,12 @@ def get_slack_formatted_date(shift_date):
 
     return f"<!date^{int(date_time.timestamp())}^{{date}}|{shift_date}>"
 
-def get_day_formatted(day_of_week, shift_date):
-    """Get the shift date formatted with slack"""
+def get_day_formatted(day_of_week, shift_date, today=None):
+    """Get the shift date formatted with slack, relative to today (the actual today if not given)"""
     formatted_date = get_slack_formatted_date(shift_date)
 
-    date_diff = (shift_date - date.today()).days
+    today = today if today is not None else date.today()
+    date_diff = (shift_date - today).days
     if date_diff <= 0: # should never be less than but for saftey
         return f"*Today* ({formatted_date})"
     elif date_diff < 7:
@@ -70,13 +42,49 @@ def get_day_formatted(day_of_week, shift_date):
     else:
         return f"next *{day_of_week}* ({formatted_date})"
 
-def send_volunteer_warning_message(config: MessageConfig, day_of_week, shift_date, volunteers, has_keyholder):
+def send_shift_message(config: MessageConfig, message_type, shift_date, message, tenant: Tenant):
+    """
+    Sends the message about the shift unless the exact same message was already sent for this config and shift
+    (see MessageLedger). If a different one was, it is edited to the new message in the "edit" ledger mode.
+    Change alerts skip the ledger and are always posted
+    """
+    if tenant.message_sink is not None:
+        # simulations (see simulator.py) collect the messages instead of sending them
+        tenant.message_sink(config.channel, message)
+        return
+
+    ledger_mode = get_ledger_mode()
+    # each change alert is about a new change to the shift (someone who dropped, came back and dropped again gets
+    # the same text twice) and they are only sent once per change, so they are always posted
+    if ledger_mode == "off" or message_type == CHANGE_ALERT:
+        send_message(config.channel, message, token=tenant.slack_token)
+        return
+
+    ledger = get_message_ledger()
+    config_key = get_config_key(message_type, config)
+    content_hash = get_content_hash(config.channel, message)
+
+    entry = ledger.get(tenant.name, config_key, shift_date)
+    if entry is not None and entry.content_hash == content_hash:
+        logging.info(f"Already sent this {message_type} message for {shift_date} to {config.channel}, not sending it again")
+        return
+
+    # chat.update needs the channel id slack gave back, not the channel name
+    edit = ledger_mode == "edit" and entry is not None
+    channel = entry.channel_id if edit else config.channel
+
+    def on_sent(response):
+        ledger.record(tenant.name, config_key, shift_date, content_hash, response["channel"], response["ts"])
+
+    send_message(channel, message, token=tenant.slack_token, ts=entry.ts if edit else None, on_sent=on_sent)
+
+def send_volunteer_warning_message(config: MessageConfig, day_of_week, shift_date, volunteers, has_keyholder, tenant: Tenant, today=None, message_type="shift_warning"):
     """
     Sends a warning message if the number of volunteers is below the VOLUNTEER threshold
-    or if shift is missing a keyholder
+    or if shift is missing a keyholder. Change alerts send it with message_type CHANGE_ALERT
     """
     message = "<!channel> " if config.notify_channel else ""
-    message += f"For the shift {get_day_formatted(day_of_week, shift_date)}:\n"
+    message += f"For the shift {get_day_formatted(day_of_week, shift_date, today)}:\n"
 
     if len(volunteers) < config.volunteer_threshold:
     
@@ -85,33 +93,33 @@ def send_volunteer_warning_message(config: MessageConfig, day_of_week, shift_dat
         else:
             message += f"*•* We need more wrenches! No one has signed up :cry:\n"
             
-        message += f"\t• *Sign up here: <{SHEET_URL}|Calendar>*\n" # respectfully fuck slack for using this weird flavor of "markdown"
+        message += f"\t• *Sign up here: <{tenant.sheet_url}|Calendar>*\n" # respectfully fuck slack for using this weird flavor of "markdown"
     if not has_keyholder:
         # TODO respect config.notify_keyholders
         message += f"*•* We need a keyholder! (Remember to put {config.get_keyholder_marks_list()} after your name if are a keyholder)\n"
         
     logging.info("sending message: " + message)
-    send_message(config.channel, message)
+    send_shift_message(config, message_type, shift_date, message, tenant)
 
 
-def send_special_note_message(config: MessageConfig, day_of_week, shift_date, special_notes):
+def send_special_note_message(config: MessageConfig, day_of_week, shift_date, special_notes, tenant: Tenant, today=None):
     """Sends a message to a slack channel with any notes for the shift left in the calendar"""
     message = "<!channel> " if config.notify_channel else ""
-    message += f"For the shift {get_day_formatted(day_of_week, shift_date)} there are the following notes:\n"
+    message += f"For the shift {get_day_formatted(day_of_week, shift_date, today)} there are the following notes:\n"
 
     for special_note in special_notes:
         message += f"*•* {special_note}\n"
     
     logging.info("sending message: " + message)
-    send_message(config.channel, message)
+    send_shift_message(config, "shift_notes", shift_date, message, tenant)
 
-def send_bike_school_message(config: MessageConfig, day_of_week, shift_date, special_notes):
+def send_bike_school_message(config: MessageConfig, day_of_week, shift_date, special_notes, tenant: Tenant, today=None):
     """Sends a message to a slack channel with any notes for the shift left in the calendar"""
     message = "<!channel> " if config.notify_channel else ""
-    message += f"Reminder Bike Skool is {get_day_formatted(day_of_week, shift_date)}! These are the notes:\n"
+    message += f"Reminder Bike Skool is {get_day_formatted(day_of_week, shift_date, today)}! These are the notes:\n"
 
     for special_note in special_notes:
         message += f"*•* {special_note}\n"
     
     logging.info("sending message: " + message)
-    send_message(config.channel, message)
\ No newline at end of file
+    send_shift_message(config, "bike_school_reminder", shift_date, message, tenant)
\ No newline at end of file
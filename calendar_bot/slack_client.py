@@ -0,0 +1,303 @@
+import os
+import logging
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from calendar_bot.tracing import add_count, wrap
+
+# slack allows about one chat.postMessage per second per channel with short bursts above that
+# https://api.slack.com/methods/chat.postMessage#rate_limiting
+MESSAGES_PER_SECOND = 1
+MESSAGE_BURST = 3
+
+# how many times a message is tried before giving up on it
+MAX_ATTEMPTS = 5
+
+# how many channels are sent to at the same time
+MAX_CONCURRENT_CHANNELS = 8
+
+
+@dataclass
+class QueuedMessage:
+    channel: str
+    text: Optional[str]
+    blocks: Optional[list] = None
+    attempts: int = 0
+    # ts of a message to replace with chat.update instead of posting a new one
+    ts: Optional[str] = None
+    # called with slacks response once the message was sent, like to save the ts slack gave it
+    on_sent: Optional[Callable] = None
+
+
+def get_is_server_error(error):
+    """
+    Whether a SlackApiError is slack (or something in front of it) failing rather than slack rejecting the message.
+    Those are retried. A non json body (like an html error page) comes back as an error with the status code it had
+    """
+    if error.response.status_code >= 500:
+        return True
+    return str(error.response.get("error", "")).startswith("Received a response in a non-JSON format")
+
+
+class TokenBucket:
+    """
+    Allows up to `capacity` messages at once and then `rate` messages per second after that.
+    Can also be paused, for example when slack says to retry after some amount of time
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        # tokens only start refilling again after this time
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until_available(self, now):
+        """How many seconds until a message can be sent (0 if one can be sent now)"""
+        self._refill(now)
+        wait_for_pause = max(self.updated - now, 0)
+        wait_for_token = max((1 - self.tokens) / self.rate, 0)
+        return wait_for_pause + wait_for_token
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        """Nothing can be sent for the given number of seconds, after that only one message until the bucket refills"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1)
+        self.updated = max(self.updated, now + seconds)
+
+
+class SlackSender:
+    """
+    Queues messages per channel and sends them with one reused slack client. Each channel has its own token bucket
+    and is sent to from its own thread, so channels are sent to in parallel and being rate limited in one channel
+    does not hold up the messages for the other channels. Messages within a channel are always sent in order
+    """
+
+    def __init__(self, token, rate=MESSAGES_PER_SECOND, burst=MESSAGE_BURST, max_attempts=MAX_ATTEMPTS, max_workers=MAX_CONCURRENT_CHANNELS):
+        self.token = token
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.max_workers = max_workers
+        self._client = None
+        self._queues = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        # tenants that share a token share a sender, only one of them flushes it at a time
+        self._flush_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # the WebClient does not keep any state between requests so it is safe to share between threads
+        with self._lock:
+            if self._client is None:
+                # imported here so runs (and triggers) that never send a message never load slack_sdk
+                from slack_sdk import WebClient
+                # the slack_api_url setting points the client somewhere else, like the fake server in benchmarks/
+                base_url = os.getenv('slack_api_url')
+                self._client = WebClient(token=self.token, base_url=base_url) if base_url else WebClient(token=self.token)
+            return self._client
+
+    def queue_message(self, channel_id, message, use_blocks=False, fallback_text=None, ts=None, on_sent=None):
+        """
+        Adds a message to the channels queue, it is not sent until flush is called. If ts is given the message
+        with that ts is replaced instead. on_sent(response) is called once slack accepted the message
+        """
+        if use_blocks:
+            queued_message = QueuedMessage(channel_id, fallback_text, blocks=message, ts=ts, on_sent=on_sent)
+        else:
+            queued_message = QueuedMessage(channel_id, message, ts=ts, on_sent=on_sent)
+
+        with self._lock:
+            self._queues.setdefault(channel_id, deque()).append(queued_message)
+            self._buckets.setdefault(channel_id, TokenBucket(self.rate, self.burst))
+
+    def update_message(self, channel_id, ts, message, use_blocks=False, fallback_text=None):
+        """Replaces the content of a message that was already sent. Sent right away instead of being queued"""
+        if use_blocks:
+            return self.client.chat_update(channel=channel_id, ts=ts, text=fallback_text, blocks=message)
+
+        return self.client.chat_update(channel=channel_id, ts=ts, text=message)
+
+    def _post(self, queued_message: QueuedMessage):
+        if queued_message.ts is not None:
+            if queued_message.blocks is not None:
+                return self.client.chat_update(channel=queued_message.channel, ts=queued_message.ts, text=queued_message.text, blocks=queued_message.blocks)
+            return self.client.chat_update(channel=queued_message.channel, ts=queued_message.ts, text=queued_message.text)
+
+        if queued_message.blocks is not None:
+            return self.client.chat_postMessage(
+                channel=queued_message.channel,
+                text=queued_message.text,
+                blocks=queued_message.blocks
+            )
+
+        return self.client.chat_postMessage(
+            channel=queued_message.channel,
+            text=queued_message.text,
+        )
+
+    def _send_next(self, channel_id, now):
+        """
+        Tries to send the next message in the channels queue. Returns "sent", "failed" (given up on) or
+        None if it should be retried later
+        """
+        from slack_sdk.errors import SlackApiError
+
+        queue = self._queues[channel_id]
+        bucket = self._buckets[channel_id]
+        queued_message = queue[0]
+        queued_message.attempts += 1
+        bucket.take(now)
+
+        try:
+            response = self._post(queued_message)
+            logging.info(f"Message sent successfully to {channel_id}")
+            add_count("slack_messages_sent")
+            queue.popleft()
+            if queued_message.on_sent is not None:
+                self._call_on_sent(queued_message, response)
+            return "sent"
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                # The `Retry-After` header will tell you how long to wait before retrying
+                headers = e.response.headers
+                delay = int(headers.get('Retry-After', headers.get('retry-after', 1)))
+                logging.info(f"Rate limited in {channel_id}. Retrying in {delay} seconds")
+                add_count("slack_rate_limited")
+                bucket.pause(now, delay)
+            elif get_is_server_error(e):
+                # slack having trouble, back off exponentially before retrying like a network error
+                delay = 2 ** queued_message.attempts
+                logging.warning(f"Slack error sending message to {channel_id}: {e}. Retrying in {delay} seconds")
+                add_count("slack_errors")
+                bucket.pause(now, delay)
+            elif queued_message.ts is not None:
+                # the message to edit is gone (or can not be edited by the bot), post it as a new message instead
+                logging.warning(f"Could not edit message {queued_message.ts} in {channel_id}: {e}. Posting it instead")
+                queued_message.ts = None
+                return None
+            else:
+                # anything else slack rejected (like the channel not existing) will not fix itself
+                logging.error(f"Error sending message to {channel_id}: {e}")
+                add_count("slack_messages_failed")
+                queue.popleft()
+                return "failed"
+        except Exception as e:
+            # network errors and the like, back off exponentially before retrying
+            delay = 2 ** queued_message.attempts
+            logging.warning(f"Error sending message to {channel_id}: {e}. Retrying in {delay} seconds")
+            add_count("slack_errors")
+            bucket.pause(now, delay)
+
+        if queued_message.attempts >= self.max_attempts:
+            logging.error(f"Giving up on message to {channel_id} after {queued_message.attempts} attempts: {queued_message.text}")
+            add_count("slack_messages_failed")
+            queue.popleft()
+            return "failed"
+
+        return None
+
+    def _call_on_sent(self, queued_message: QueuedMessage, response):
+        try:
+            queued_message.on_sent(response)
+        except Exception:
+            # the message was still sent, so it is not retried
+            logging.exception(f"Handling the response for the message sent to {queued_message.channel} failed")
+
+    def _flush_channel(self, channel_id):
+        """Sends every queued message in the channel in order. Returns how many were sent and how many failed"""
+        queue = self._queues[channel_id]
+        bucket = self._buckets[channel_id]
+        num_sent = 0
+        num_failed = 0
+
+        while queue:
+            wait = bucket.time_until_available(time.monotonic())
+            if wait > 0:
+                # only this channels thread waits, the other channels keep sending
+                time.sleep(wait)
+
+            result = self._send_next(channel_id, time.monotonic())
+            if result == "sent":
+                num_sent += 1
+            elif result == "failed":
+                num_failed += 1
+
+        return num_sent, num_failed
+
+    def flush(self):
+        """
+        Sends every queued message, each channel in parallel and the messages within each channel in order.
+        Logs one summary line of how many messages were sent and failed, and returns them as (num_sent, num_failed)
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            channels = [channel_id for channel_id, queue in self._queues.items() if queue]
+
+        if not channels:
+            return 0, 0
+
+        start = time.monotonic()
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(channels))) as executor:
+            futures = {channel_id: executor.submit(wrap(self._flush_channel), channel_id) for channel_id in channels}
+
+            for channel_id, future in futures.items():
+                try:
+                    results[channel_id] = future.result()
+                except Exception as e:
+                    logging.error(f"Error sending messages to {channel_id}: {e}")
+                    results[channel_id] = (0, len(self._queues[channel_id]))
+                    self._queues[channel_id].clear()
+
+        num_sent = sum(sent for sent, _ in results.values())
+        num_failed = sum(failed for _, failed in results.values())
+        per_channel = ", ".join(f"{channel_id}: {sent} sent {failed} failed" for channel_id, (sent, failed) in results.items())
+        logging.info(f"Sent {num_sent} messages ({num_failed} failed) to {len(channels)} channels in {time.monotonic() - start:.2f}s ({per_channel})")
+        return num_sent, num_failed
+
+
+# one sender (and slack client) per token for the whole process
+_senders = {}
+_senders_lock = threading.Lock()
+
+def get_slack_sender(token=None) -> SlackSender:
+    """Returns the sender for the given token, the slack_token setting if no token is given"""
+    token = token if token is not None else os.getenv('slack_token')
+    with _senders_lock:
+        if token not in _senders:
+            _senders[token] = SlackSender(token)
+        return _senders[token]
+
+def send_message(channel_id, message, use_blocks=False, fallback_text=None, token=None, ts=None, on_sent=None):
+    """
+    Queues the given message for the specified channel. Messages are sent (respecting rate limits) by flush_messages.
+    See SlackSender.queue_message for ts and on_sent
+    """
+    get_slack_sender(token).queue_message(channel_id, message, use_blocks, fallback_text, ts, on_sent)
+
+def flush_messages(token=None):
+    """Sends every queued message, returns (num_sent, num_failed)"""
+    return get_slack_sender(token).flush()
+
+def update_message(channel_id, ts, message, use_blocks=False, fallback_text=None, token=None):
+    """Replaces the content of the message with the given ts in the channel"""
+    return get_slack_sender(token).update_message(channel_id, ts, message, use_blocks, fallback_text)
@@ -2,9 +2,13 @@ from pprint import pprint
 import re
 import requests
 import json
+import logging
+import threading
 
 from calendar_bot.config import *
-from calendar_bot.slack import send_message
+from calendar_bot.slack_client import send_message, flush_messages, update_message
+from calendar_bot.poll_store import Poll, get_poll_store
+from calendar_bot.update_coalescer import get_update_coalescer
 
 def get_question_section(question, notify_channel):
     message_text = f"<!channel> *{question}*" if notify_channel else f"*{question}*"
@@ -19,7 +23,15 @@ def get_question_section(question, notify_channel):
 
 EMOJI_LIST = [":one:", ":two:", ":three:", ":four:", ":five:", ":six:", ":seven:", ":eight:", ":nine:"]
 
-def get_option_section(option, option_index):
+def get_option_text(option, option_index, user_ids=()):
+    """Text of an option section, the option with how many picked it and who picked it"""
+    text = f"{EMOJI_LIST[option_index]} {option}    `{len(user_ids)}`\n"
+    if user_ids:
+        # format user ids into a string slack understands
+        text += ", ".join(f"<@{user_id}>" for user_id in user_ids) + "\n"
+    return text
+
+def get_option_section(option, option_index, user_ids=()):
     if option_index < 0 or option_index >= len(EMOJI_LIST):
         raise Exception("There must be at most nine options")
     
@@ -29,7 +41,7 @@ def get_option_section(option, option_index):
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": f"{option_emoji} {option}    `0`\n"
+            "text": get_option_text(option, option_index, user_ids)
         },
         "accessory": {
             "type": "button",
@@ -43,12 +55,12 @@ def get_option_section(option, option_index):
         }
     }
 
-def get_num_respondents():
+def get_num_respondents(num_respondents=0):
     return {
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": "*Respondents:* `0`\n"
+            "text": f"*Respondents:* `{num_respondents}`\n"
         }
     }
 
@@ -72,91 +84,138 @@ def create_poll(question, options, notify_channel=False):
         message=blocks, 
         use_blocks=True, 
         fallback_text=f"Poll: {question}")
+    flush_messages()
     
 
-# update poll option section by either adding or removing user from section
-def update_response(blocks, user_id, option_index: int):
-    block_to_update = blocks[option_index + 1] # plus one due to question block
-
-    text_split = block_to_update['text']['text'].splitlines()
-
-    prefix_text = text_split[0]
-    user_list_raw = text_split[1] if len(text_split) > 1 else ''
-
-    # get all user ids who have selected this option
-    user_ids = [s.replace('<@', '').replace('>', '') for s in re.findall(r'<@[A-Z0-9]+>', user_list_raw)]
-
-    # check if current user has not responded
-    should_add_user = not user_id in user_ids
-
-    if should_add_user:
-        user_ids.append(user_id)
-    else:
-        user_ids.remove(user_id)
-
-    # update the number of users who have selected this option
-    prefix_text_split = prefix_text.split('`')
-    prefix_text_split[-2] = f"{len(user_ids)}"
-    prefix_text = '`'.join(prefix_text_split)
-
-    # format user ids into a string slack understands 
-    formatted_user_ids = [f"<@{id}>" for id in user_ids]
-
-    block_to_update['text']['text'] = f"{prefix_text}\n{', '.join(formatted_user_ids)}\n"
-    
-
-    
-# updates the last section that contains the total number of unique users who have responded to the poll
-def update_num_responses(blocks):
-    # get all the user ids who have responded
-    user_ids = [s.replace('<@', '').replace('>', '') for s in re.findall(r'<@[A-Z0-9]+>', str(blocks))]
+def render_poll(poll: Poll):
+    """Builds the blocks of the poll message from the polls state"""
+    blocks = list(poll.header_blocks)
+
+    for option_index, option in enumerate(poll.options):
+        blocks.append(get_option_section(option, option_index, list(poll.voters[option_index])))
+
+    blocks.append(get_num_respondents(poll.num_respondents))
+
+    return blocks
+
+# the first line of an option sections text, the emoji, the option and the count
+OPTION_LINE_PATTERN = re.compile(r"^(?::[a-z]+: )?(.*?)\s*`\d+`$")
+
+def get_poll_from_blocks(ts, blocks) -> Poll:
+    """
+    Reads the state of a poll back out of its blocks, for polls the store does not know yet (like ones sent
+    before there was a store). Only done once per poll, every vote after that updates the stored state
+    """
+    header_blocks = []
+    options = []
+    voters = []
+
+    for block in blocks:
+        accessory = block.get('accessory', {})
+        if accessory.get('action_id') == "option-select":
+            lines = block['text']['text'].splitlines()
+            match = OPTION_LINE_PATTERN.match(lines[0]) if lines else None
+            options.append(match.group(1) if match else lines[0] if lines else '')
+            # get all user ids who have selected this option
+            voters.append(re.findall(r'<@([A-Z0-9]+)>', lines[1]) if len(lines) > 1 else [])
+        elif not options:
+            header_blocks.append(block)
+
+    poll = Poll(ts, header_blocks, options)
+    for option_index, option_voters in enumerate(voters):
+        for user_id in option_voters:
+            poll.add_vote(user_id, option_index)
+
+    return poll
+
+# slack only allows a response_url to be used five times (within 30 minutes), after that the message is updated
+# with chat.update instead
+RESPONSE_URL_MAX_USES = 5
+
+# how many times each response_url has been used, only the most recent ones are kept
+_response_url_uses = {}
+_response_url_uses_lock = threading.Lock()
+MAX_TRACKED_RESPONSE_URLS = 1000
+
+# seconds to wait for slack to accept the connection and to answer when posting to a response_url, like the sheets
+# requests. A response_url that hangs falls back to chat.update
+RESPONSE_URL_CONNECT_TIMEOUT = 5
+RESPONSE_URL_READ_TIMEOUT = 10
+
+def use_response_url(response_url):
+    """Counts a use of the response_url, returns False if it has already been used as many times as slack allows"""
+    with _response_url_uses_lock:
+        uses = _response_url_uses.pop(response_url, 0)
+        if uses >= RESPONSE_URL_MAX_USES:
+            _response_url_uses[response_url] = uses
+            return False
+
+        _response_url_uses[response_url] = uses + 1
+        if len(_response_url_uses) > MAX_TRACKED_RESPONSE_URLS:
+            del _response_url_uses[next(iter(_response_url_uses))]
+        return True
+
+def send_poll_update(ts, channel_id, response_url):
+    """Replaces the poll message with the polls current state, through the response_url if it can still be used"""
+    blocks = render_poll(get_poll_store().get_poll(ts))
+
+    if use_response_url(response_url):
+        data = {
+            "replace_original": "true",
+            "blocks": blocks
+        }
 
-    num_unique_users = len(set(user_ids))
+        headers = {
+            'Content-type': 'application/json'
+        }
 
-    last_block = blocks[-1]
+        # update the poll message with the new body
+        try:
+            response = requests.post(response_url, data=json.dumps(data), headers=headers, timeout=(RESPONSE_URL_CONNECT_TIMEOUT, RESPONSE_URL_READ_TIMEOUT))
+        except requests.RequestException as e:
+            logging.warning(f"Updating poll {ts} through the response_url failed: {e}")
+        else:
+            if response.status_code == 200:
+                logging.info(f"Updated poll {ts}")
+                return
 
-    block_text = last_block['text']['text']
-    # update number in text
-    block_text_split = block_text.split('`')
-    block_text_split[-2] = f"{num_unique_users}"
-    block_text = '`'.join(block_text_split)
+            logging.warning(f"Updating poll {ts} through the response_url failed with status {response.status_code}")
 
-    last_block['text']['text'] = block_text
+    if channel_id is None:
+        # chat.update needs the channel, which not every interaction payload has
+        logging.error(f"Could not update poll {ts}, the response_url can not be used and the channel is not known")
+        return
 
+    update_message(channel_id, ts, blocks, use_blocks=True, fallback_text="Poll")
+    logging.info(f"Updated poll {ts} with chat.update")
 
 def update_poll(body_json):
+    """
+    Applies the votes of a button press to the poll and returns right away so the interaction can be acknowledged.
+    The message is re-rendered shortly after on a background thread, once for all the clicks on the poll in that
+    time (see UpdateCoalescer). Call get_update_coalescer().flush() to wait for it
+    """
     # id of user who pressed button
     user_id = body_json['user']['id']
 
-    # old message to be updated
-    blocks = body_json['message']['blocks']
+    # the poll message, its ts is what the poll is stored under
+    message = body_json['message']
+    ts = message['ts']
+    channel_id = body_json.get('channel', {}).get('id') or body_json.get('container', {}).get('channel_id')
 
     # list of actions the user took
     actions = body_json['actions']
 
+    store = get_poll_store()
+    if store.get_poll(ts) is None:
+        store.add_poll(get_poll_from_blocks(ts, message['blocks']))
+
+    # votes are applied as the clicks come in, only the rendering is delayed
     for action in actions:
         option_index = int(action['value'])
         # add or remove them from an option
-        update_response(blocks, user_id, option_index)
-
-    # update total number of unique users who have responded    
-    update_num_responses(blocks)
-
-    data = {
-        "replace_original": "true",
-        "blocks": blocks
-    }
-
-    headers = {
-        'Content-type': 'application/json'
-    }
+        store.toggle_vote(ts, user_id, option_index)
 
+    # the latest click's response_url is the one used, it is the least likely to have run out
     response_url = body_json['response_url']
-
-    # update the poll message with the new body
-    response = requests.post(response_url, data=json.dumps(data), headers=headers)
-
-    if response.status_code == 200:
-        print("Update message successful")
-    else:
-        print(f"Update message failed {response}")
+    get_update_coalescer().schedule(ts, lambda: send_poll_update(ts, channel_id, response_url))
@@ -0,0 +1,183 @@
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional
+
+from calendar_bot.shifts import Shift
+from calendar_bot.sqlite_store import SqliteStore, get_store
+
+# the shifts are saved separately for each of these so the daily run and change alerts each see their own changes
+DAILY_RUN_BASELINE = "daily_run"
+CHANGE_ALERTS_BASELINE = "change_alerts"
+
+
+@dataclass
+class ShiftChange:
+    """What changed about a shift since the last run"""
+    date: date
+    added_volunteers: List[str] = field(default_factory=list)
+    removed_volunteers: List[str] = field(default_factory=list)
+    added_notes: List[str] = field(default_factory=list)
+    removed_notes: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        changes = []
+        if self.added_volunteers:
+            changes.append(f"signed up: {', '.join(self.added_volunteers)}")
+        if self.removed_volunteers:
+            changes.append(f"dropped: {', '.join(self.removed_volunteers)}")
+        if self.added_notes:
+            changes.append(f"new notes: {', '.join(self.added_notes)}")
+        if self.removed_notes:
+            changes.append(f"removed notes: {', '.join(self.removed_notes)}")
+        return f"{self.date} ({'; '.join(changes)})"
+
+
+@dataclass
+class PendingChange:
+    """A sheet that changed and has not been checked since, with when it first and last changed"""
+    sheet_id: str
+    first_changed_at: float
+    last_changed_at: float
+
+
+@dataclass
+class Watch:
+    """A drive watch on a calendar. Drive sends the channel id, resource id and token back with every notification"""
+    channel_id: str
+    sheet_id: str
+    resource_id: str
+    token: str
+    expires_at: float
+
+
+class SnapshotStore(SqliteStore):
+    """
+    Keeps the upcoming shifts from the last run in a sqlite database so the next run can tell what changed about
+    each shift (new signups, dropped volunteers, new notes).
+
+    The database can be on the functions temp disk or on a mounted file share to survive across instances
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS shift_baselines (
+            baseline TEXT, sheet_id TEXT, date TEXT, volunteers TEXT, special_notes TEXT,
+            PRIMARY KEY (baseline, sheet_id, date)
+        );
+        CREATE TABLE IF NOT EXISTS pending_changes (
+            sheet_id TEXT PRIMARY KEY, first_changed_at REAL, last_changed_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS watches (
+            channel_id TEXT PRIMARY KEY, sheet_id TEXT, resource_id TEXT, token TEXT, expires_at REAL
+        );
+    """
+
+    def update_shifts(self, sheet_id, shifts: List[Shift], baseline=DAILY_RUN_BASELINE) -> List[ShiftChange]:
+        """
+        Saves the given shifts as the baseline and returns what changed about each of them since they were last
+        saved to the same baseline. Each baseline is kept separately so the daily run and change alerts do not
+        overwrite what the other saw. Shifts that were never saved before are not counted as changed
+        """
+        changes = self.get_shift_changes(sheet_id, shifts, baseline)
+        self.save_shifts(sheet_id, shifts, baseline)
+        return changes
+
+    def get_shift_changes(self, sheet_id, shifts: List[Shift], baseline=DAILY_RUN_BASELINE) -> List[ShiftChange]:
+        """What changed about each of the shifts since it was last saved to the baseline, without saving them"""
+        if not shifts:
+            return []
+
+        dates = [shift.date.isoformat() for shift in shifts]
+
+        with self._lock:
+            stored_shifts = self._connection.execute(
+                f"SELECT date, volunteers, special_notes FROM shift_baselines WHERE baseline = ? AND sheet_id = ? AND date IN ({','.join('?' * len(dates))})",
+                (baseline, sheet_id, *dates)
+            ).fetchall()
+        stored_shifts = {shift_date: (json.loads(volunteers), json.loads(notes)) for shift_date, volunteers, notes in stored_shifts}
+
+        changes = []
+
+        for shift in shifts:
+            stored_shift = stored_shifts.get(shift.date.isoformat())
+            if stored_shift is None:
+                continue
+
+            old_volunteers, old_notes = stored_shift
+            change = ShiftChange(
+                shift.date,
+                added_volunteers=[volunteer for volunteer in shift.volunteers if volunteer not in old_volunteers],
+                removed_volunteers=[volunteer for volunteer in old_volunteers if volunteer not in shift.volunteers],
+                added_notes=[note for note in shift.special_notes if note not in old_notes],
+                removed_notes=[note for note in old_notes if note not in shift.special_notes],
+            )
+
+            if change.added_volunteers or change.removed_volunteers or change.added_notes or change.removed_notes:
+                changes.append(change)
+
+        return changes
+
+    def save_shifts(self, sheet_id, shifts: List[Shift], baseline=DAILY_RUN_BASELINE, replace=True):
+        """
+        Saves the shifts to the baseline. With replace=False only the shifts the baseline does not have yet are
+        saved, the ones it has are left as they were (used to seed a baseline without hiding changes from it)
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO shift_baselines VALUES (?, ?, ?, ?, ?)",
+                [(baseline, sheet_id, shift.date.isoformat(), json.dumps(shift.volunteers), json.dumps(shift.special_notes)) for shift in shifts]
+            )
+
+    def add_pending_change(self, sheet_id, now=None):
+        """Records that the sheet changed and has not been checked yet, keeping when the first unchecked change was"""
+        now = now if now is not None else time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO pending_changes VALUES (?, ?, ?) ON CONFLICT (sheet_id) DO UPDATE SET last_changed_at = excluded.last_changed_at",
+                (sheet_id, now, now)
+            )
+
+    def get_settled_changes(self, quiet_seconds, max_wait_seconds, now=None) -> List[PendingChange]:
+        """
+        Returns the pending changes of the sheets that have not changed again for quiet_seconds, or have been
+        waiting longer than max_wait_seconds even though they keep changing. They stay pending until they are
+        removed with remove_pending_change once they were checked
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT sheet_id, first_changed_at, last_changed_at FROM pending_changes WHERE last_changed_at <= ? OR first_changed_at <= ?",
+                (now - quiet_seconds, now - max_wait_seconds)
+            ).fetchall()
+        return [PendingChange(*row) for row in rows]
+
+    def remove_pending_change(self, pending_change: PendingChange):
+        """Forgets a pending change once it was checked, unless the sheet changed again since it was read"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM pending_changes WHERE sheet_id = ? AND last_changed_at <= ?",
+                (pending_change.sheet_id, pending_change.last_changed_at)
+            )
+
+    def add_watch(self, channel_id, sheet_id, resource_id, token, expires_at, now=None):
+        """Saves a drive watch on the sheet so its notifications can be checked, and forgets the expired ones"""
+        now = now if now is not None else time.time()
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM watches WHERE expires_at <= ?", (now,))
+            self._connection.execute("INSERT OR REPLACE INTO watches VALUES (?, ?, ?, ?, ?)", (channel_id, sheet_id, resource_id, token, expires_at))
+
+    def get_watch(self, channel_id, now=None) -> Optional[Watch]:
+        """The watch with the given channel id, None if there is none or it expired"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT channel_id, sheet_id, resource_id, token, expires_at FROM watches WHERE channel_id = ? AND expires_at > ?",
+                (channel_id, now)
+            ).fetchone()
+        return Watch(*row) if row else None
+
+
+def get_snapshot_store(path=None) -> SnapshotStore:
+    """Returns the snapshot store for the process (one per path)"""
+    return get_store(SnapshotStore, 'snapshot_store_path', "calendar_bot_snapshot.sqlite3", path)
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+
+class SqliteStore:
+    """
+    Base of the stores kept in a sqlite database (snapshots, polls, sent messages). One connection is shared by
+    every thread of the process behind a lock. The database can be on the functions temp disk or on a mounted file
+    share so every instance sees the same data
+    """
+
+    # the tables of the store, created if they do not exist yet
+    SCHEMA = ""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._connection:
+            self._connection.executescript(self.SCHEMA)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(store_class, path_setting, file_name, path=None):
+    """
+    Returns the store of the given class for the process (one per path). The path defaults to the path_setting
+    setting, or file_name in the temp directory if that is not set
+    """
+    path = path if path is not None else os.getenv(path_setting, os.path.join(tempfile.gettempdir(), file_name))
+    with _stores_lock:
+        if (store_class, path) not in _stores:
+            _stores[(store_class, path)] = store_class(path)
+        return _stores[(store_class, path)]
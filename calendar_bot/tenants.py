@@ -0,0 +1,80 @@
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+
+@dataclass
+class Tenant:
+    """One shop calendar the bot runs for, with its own spreadsheet, config sheet and slack workspace"""
+    name: str
+    # Can find in the URL: https://docs.google.com/spreadsheets/d/{sheet_id}/
+    sheet_id: str
+    config_sheet_id: Optional[str] = None
+    config_sheet_gid: Optional[str] = None
+    slack_token: Optional[str] = None
+    # where errors about the tenant (like a broken config sheet) are sent
+    error_channel: str = "#bot-tester"
+    # if set, messages are passed to message_sink(channel, message) instead of being sent to slack
+    message_sink: Optional[Callable] = field(default=None, repr=False, compare=False)
+
+    @property
+    def sheet_url(self):
+        return f"https://docs.google.com/spreadsheets/d/{self.sheet_id}/edit"
+
+
+def tenant_from_dict(data_dict) -> Tenant:
+    """Builds a tenant from one entry of the calendar_bot_tenants setting, the slack token defaults to slack_token"""
+    data_dict = dict(data_dict)
+    data_dict.setdefault('name', data_dict.get('sheet_id'))
+    data_dict.setdefault('slack_token', os.getenv('slack_token'))
+    return Tenant(**data_dict)
+
+def get_default_tenant() -> Tenant:
+    """The single tenant set up with the SHEET_ID, CONFIG_SHEET_ID, CONFIG_SHEET_GID and slack_token settings"""
+    sheet_id = os.getenv('SHEET_ID')
+    if sheet_id is None:
+        raise Exception("Environment Variable SHEET_ID is required")
+
+    return Tenant(
+        name="default",
+        sheet_id=sheet_id,
+        config_sheet_id=os.getenv('CONFIG_SHEET_ID'),
+        config_sheet_gid=os.getenv('CONFIG_SHEET_GID'),
+        slack_token=os.getenv('slack_token'),
+    )
+
+def get_tenants() -> List[Tenant]:
+    """
+    Returns every tenant to run for. They are listed as a json array in the calendar_bot_tenants setting, like
+    [{"name": "shop", "sheet_id": "...", "config_sheet_id": "...", "config_sheet_gid": "0", "slack_token": "..."}]
+    and if that is not set it is just the default tenant
+    """
+    raw_tenants = os.getenv('calendar_bot_tenants')
+    if not raw_tenants:
+        return [get_default_tenant()]
+
+    return [tenant_from_dict(tenant) for tenant in json.loads(raw_tenants)]
+
+
+class TenantErrors:
+    """
+    Collects the errors of the tenants that failed during a run so one tenant failing does not stop the others.
+    raise_if_any raises them together once every tenant is done
+    """
+
+    def __init__(self, action, num_tenants):
+        # what was being done, like "Sending messages"
+        self.action = action
+        self.num_tenants = num_tenants
+        self.errors = {}
+
+    def add(self, tenant_name, error):
+        """Logs the error with its traceback, call it from the except block"""
+        logging.exception(f"{self.action} for tenant {tenant_name} failed")
+        self.errors[tenant_name] = error
+
+    def raise_if_any(self):
+        if self.errors:
+            raise Exception(f"{self.action} failed for {len(self.errors)} of {self.num_tenants} tenants: {', '.join(self.errors)}") from next(iter(self.errors.values()))
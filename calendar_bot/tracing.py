@@ -0,0 +1,203 @@
+"""
+Lightweight tracing of a bot run. A run is split into spans (one per stage, like downloading the calendar or
+getting the config) that record how long they took and counters like bytes downloaded, cells parsed, http retries
+and slack rate limits. When the run finishes one json summary line is logged, and the spans are also sent to
+OpenTelemetry if that is turned on.
+
+Turned on with the calendar_bot_tracing setting ("True"). When it is off span() and add_count() only check a
+context variable and return, so the instrumentation can stay in the code.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+# the span the current code is running in, None when no run is being traced
+_current_span = contextvars.ContextVar("calendar_bot_span", default=None)
+
+# returned by span() when nothing is being traced
+_NULL_SPAN = nullcontext()
+
+
+class Span:
+    def __init__(self, run, name, parent_id, attributes):
+        self.run = run
+        self.id = len(run.spans)
+        self.name = name
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.counters: Dict[str, int] = {}
+        self.start = time.perf_counter()
+        self.start_time_ns = time.time_ns()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        span = {
+            "id": self.id,
+            "name": self.name,
+            "parent": self.parent_id,
+            "start_ms": round((self.start - self.run.root.start) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+        }
+        span.update(self.attributes)
+        span.update(self.counters)
+        if self.error is not None:
+            span["error"] = self.error
+        return span
+
+
+class Run:
+    """Every span of one traced run. Spans can be added to from several threads at once"""
+
+    def __init__(self, name, attributes):
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.root = self.add_span(name, None, attributes)
+
+    def add_span(self, name, parent_id, attributes) -> Span:
+        with self.lock:
+            span = Span(self, name, parent_id, attributes)
+            self.spans.append(span)
+            return span
+
+    def get_totals(self):
+        """Every counter summed over all the spans"""
+        totals = {}
+        for span in self.spans:
+            for name, count in span.counters.items():
+                totals[name] = totals.get(name, 0) + count
+        return totals
+
+    def get_summary(self):
+        return {
+            "run": self.root.name,
+            "duration_ms": round(self.root.duration * 1000, 1) if self.root.duration is not None else None,
+            "error": self.root.error,
+            "attributes": self.root.attributes,
+            "totals": self.get_totals(),
+            "spans": [span.to_dict() for span in self.spans[1:]],
+        }
+
+
+def get_is_tracing_enabled():
+    return os.getenv('calendar_bot_tracing') == "True"
+
+def get_is_opentelemetry_enabled():
+    return os.getenv('calendar_bot_tracing_opentelemetry') == "True"
+
+@contextmanager
+def _run_span(span: Span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.duration = time.perf_counter() - span.start
+        _current_span.reset(token)
+
+@contextmanager
+def trace_run(name, **attributes):
+    """
+    Traces everything inside the with block as one run and logs its summary at the end. Does nothing if tracing
+    is turned off or a run is already being traced (then it is just a span of that run)
+    """
+    if _current_span.get() is not None:
+        with span(name, **attributes):
+            yield
+        return
+
+    if not get_is_tracing_enabled():
+        yield
+        return
+
+    run = Run(name, attributes)
+    try:
+        with _run_span(run.root):
+            yield
+    finally:
+        log_summary(run)
+
+def span(name, **attributes):
+    """Times the with block as a span of the current run, a no op when nothing is being traced"""
+    parent = _current_span.get()
+    if parent is None:
+        return _NULL_SPAN
+
+    return _run_span(parent.run.add_span(name, parent.id, attributes))
+
+def add_count(name, amount=1):
+    """Adds to a counter of the current span"""
+    current = _current_span.get()
+    if current is None:
+        return
+
+    with current.run.lock:
+        current.counters[name] = current.counters.get(name, 0) + amount
+
+def wrap(function):
+    """
+    Returns the function so that it runs in the current span when called from another thread (like the ones of a
+    ThreadPoolExecutor), threads do not inherit context variables by themselves
+    """
+    if _current_span.get() is None:
+        return function
+
+    context = contextvars.copy_context()
+    # each call gets its own copy, a context can not be entered by two threads at the same time
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+def add_response(response):
+    """Counts the bytes (as sent over the wire, so compressed) and retries of a requests response"""
+    if _current_span.get() is None:
+        return
+
+    raw = response.raw
+    add_count("http_requests")
+    add_count("bytes_downloaded", raw.tell())
+
+    retries = getattr(raw, "retries", None)
+    if retries is not None and retries.history:
+        add_count("http_retries", len(retries.history))
+
+def log_summary(run: Run):
+    summary = run.get_summary()
+    logging.info(f"Trace summary: {json.dumps(summary, default=str)}")
+
+    if get_is_opentelemetry_enabled():
+        try:
+            export_to_opentelemetry(run)
+        except Exception as e:
+            # tracing should never be what breaks a run
+            logging.warning(f"Could not export the trace to OpenTelemetry: {e}")
+
+def export_to_opentelemetry(run: Run):
+    """
+    Replays the spans of the finished run into OpenTelemetry with their recorded times. Uses whatever tracer
+    provider and exporter the host configured (like azure monitor), so nothing is imported unless this is called
+    """
+    from opentelemetry import trace
+
+    tracer = trace.get_tracer("calendar_bot")
+    otel_spans = {}
+
+    for span in run.spans:
+        parent = otel_spans.get(span.parent_id)
+        context = trace.set_span_in_context(parent) if parent is not None else None
+
+        attributes = {key: value for key, value in {**span.attributes, **span.counters}.items() if isinstance(value, (str, bool, int, float))}
+        otel_span = tracer.start_span(span.name, context=context, start_time=span.start_time_ns, attributes=attributes)
+        if span.error is not None:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR, span.error))
+        otel_spans[span.id] = otel_span
+
+    # children end before their parents
+    for span in reversed(run.spans):
+        duration = span.duration if span.duration is not None else 0
+        otel_spans[span.id].end(end_time=span.start_time_ns + int(duration * 1e9))
@@ -0,0 +1,68 @@
+import logging
+import threading
+from typing import Callable, Dict, Set
+
+# how long to wait for more clicks on a poll before updating its message
+COALESCE_DELAY = 0.5
+
+
+class UpdateCoalescer:
+    """
+    Merges updates that are scheduled close together into one. schedule(key, update) returns right away, and
+    update runs after a short delay on a background thread. Anything else scheduled for the same key before then
+    replaces it, so a burst of clicks on a poll turns into one re-render of the latest state.
+
+    Only one update per key runs at a time and they run in the order they were scheduled, so an older render can
+    never overwrite a newer one. Updates scheduled while one is running are merged and run right after it
+    """
+
+    def __init__(self, delay=COALESCE_DELAY):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        # key -> the latest update waiting to run
+        self._pending: Dict[str, Callable] = {}
+        # keys that have a worker thread (waiting out the delay or running updates)
+        self._active: Set[str] = set()
+
+    def schedule(self, key, update: Callable):
+        with self._lock:
+            self._pending[key] = update
+            if key in self._active:
+                return
+            self._active.add(key)
+
+        timer = threading.Timer(self.delay, self._run, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self, key):
+        while True:
+            with self._lock:
+                update = self._pending.pop(key, None)
+                if update is None:
+                    self._active.discard(key)
+                    self._done.notify_all()
+                    return
+
+            try:
+                update()
+            except Exception:
+                logging.exception(f"Update for {key} failed")
+
+    def flush(self, timeout=None):
+        """Waits until every scheduled update has run. Returns False if it timed out first"""
+        with self._lock:
+            return self._done.wait_for(lambda: not self._active, timeout)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+def get_update_coalescer() -> UpdateCoalescer:
+    """Returns the coalescer for the process"""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = UpdateCoalescer()
+        return _coalescer
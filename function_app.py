@@ -5,9 +5,8 @@ import urllib.parse
 import json
 import os
 
-from calendar_bot.calendar_bot import send_slack_messages
-from calendar_bot.hide_rows import hide_rows
-from calendar_bot.slack_poll import create_poll, update_poll
+# the bot modules are imported inside each trigger so a cold start only loads what that trigger uses
+# (see benchmarks/import_time.py)
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
@@ -15,6 +14,7 @@ app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 @app.timer_trigger(schedule="0 0 15 * * *", arg_name="myTimer", run_on_startup=False, use_monitor=False) 
 def calendar_bot(myTimer: func.TimerRequest) -> None:
     logging.info('Python timer trigger function executed.')
+    from calendar_bot.calendar_bot import send_slack_messages
     send_slack_messages()
 
 
@@ -22,29 +22,37 @@ def calendar_bot(myTimer: func.TimerRequest) -> None:
 def http_trigger_bot(req: func.HttpRequest) -> func.HttpResponse:
     """Function for testing purposes only. Used to debug and force runs on different days"""
     logging.info('Python HTTP trigger function processed a request.')
+    from calendar_bot.calendar_bot import send_slack_messages
 
     delta = req.params.get('delta')
 
     if delta:
         today = date.today() + timedelta(days=int(delta))
         logging.info(today)
-        send_slack_messages(today=today)
-        return func.HttpResponse(f"Hello. Sending as if today was {today}")
+        shift_changes = send_slack_messages(today=today)
+        return func.HttpResponse(f"Hello. Sending as if today was {today}\n{get_shift_changes_text(shift_changes)}")
     else:
-        send_slack_messages()
+        shift_changes = send_slack_messages()
 
-    return func.HttpResponse(f"Hello. Sending as if today was today")
+    return func.HttpResponse(f"Hello. Sending as if today was today\n{get_shift_changes_text(shift_changes)}")
+
+def get_shift_changes_text(shift_changes):
+    """The shifts that changed since the last run of each tenant, one per line"""
+    lines = [f"{tenant_name}: {shift_change}" for tenant_name, changes in shift_changes.items() for shift_change in changes]
+    return "\n".join(lines) if lines else "No shifts changed since the last run"
 
 @app.timer_trigger(schedule=" 0 0 15 * * 0", arg_name="timer", run_on_startup=False, use_monitor=False)
 def hide_calendar_rows(timer: func.TimerRequest) -> None:
     logging.info('Hid calendar rows begin execution')
     if os.getenv('do_hide_rows_on_schedule') == "True":
+        from calendar_bot.hide_rows import hide_rows
         hide_rows()
 
 @app.route(route="http_trigger_hide_rows", auth_level=func.AuthLevel.ANONYMOUS)
 def http_trigger_hide_rows(req: func.HttpRequest) -> func.HttpResponse:
     """Function for testing purposes only. Used to debug and force runs on different days"""
     logging.info('Python HTTP trigger function attempting to hide rows')
+    from calendar_bot.hide_rows import hide_rows
 
     delta = req.params.get('delta')
 
@@ -58,15 +66,45 @@ def http_trigger_hide_rows(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(f"Hello. Hiding as if today was today")
 
 
+@app.route(route="drive_notification", auth_level=func.AuthLevel.ANONYMOUS)
+def drive_notification(req: func.HttpRequest) -> func.HttpResponse:
+    """Receives the push notifications drive sends when a watched calendar changes (see change_alerts.watch_calendar)"""
+    if os.getenv('do_change_alerts') != "True":
+        return func.HttpResponse(status_code=404)
+
+    from calendar_bot.change_alerts import handle_drive_notification
+
+    # the changes are only recorded here and checked by check_calendar_changes, drive wants a quick response
+    if not handle_drive_notification(dict(req.headers)):
+        return func.HttpResponse(status_code=403)
+    return func.HttpResponse(status_code=200)
+
+@app.timer_trigger(schedule="0 * * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def check_calendar_changes(timer: func.TimerRequest) -> None:
+    if os.getenv('do_change_alerts') == "True":
+        from calendar_bot.change_alerts import check_pending_changes
+        check_pending_changes()
+
+@app.timer_trigger(schedule="0 0 */12 * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def watch_calendars(timer: func.TimerRequest) -> None:
+    """Drive watches expire after a day so they are registered again twice a day"""
+    webhook_url = os.getenv('change_alerts_webhook_url')
+    if os.getenv('do_change_alerts') == "True" and webhook_url:
+        from calendar_bot.change_alerts import watch_calendars
+        watch_calendars(webhook_url)
+
+
 # @app.route(route="create_poll", auth_level=func.AuthLevel.ANONYMOUS)
 # def create_poll_test(req: func.HttpRequest) -> func.HttpResponse:
 #     """Function for testing purposed only. Used to manually create a poll"""
+#     from calendar_bot.slack_poll import create_poll
 #     create_poll("test question", ["Yes", "No", "I can bring food"], notify_channel=True)
 
 #     return func.HttpResponse(f"End of function")
 
 # @app.route(route="handle_interaction", auth_level=func.AuthLevel.ANONYMOUS)
 # def handle_interaction(req: func.HttpRequest) -> func.HttpResponse:
+#     from calendar_bot.slack_poll import update_poll
 #     body = urllib.parse.unquote_plus(req.get_body().decode("utf-8"))
 
 #     body_json = json.loads(body[len("payload="):])
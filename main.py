@@ -1,9 +1,25 @@
+import sys
 from datetime import date, timedelta
 
-from calendar_bot.calendar_bot import send_slack_messages
+from calendar_bot.calendar_bot import send_slack_messages, preview_messages
 
 
 if __name__ == "__main__":
-    today = date.today() + timedelta(days=14)
-    print(today)
-    send_slack_messages(today=today)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "preview":
+        # python main.py preview [days], what the bot will look at over the next days without sending anything
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+        for scheduled_message, would_send in preview_messages(date.today(), days):
+            status = "not in calendar" if would_send is None else "would send" if would_send else "nothing to send"
+            print(f"{scheduled_message.send_date} {scheduled_message.message_type} for {scheduled_message.shift_date} to {scheduled_message.config.channel}: {status}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        # python main.py simulate START END, every message the bot would send each day from START to END (YYYY-MM-DD)
+        # as json lines, without sending anything
+        from calendar_bot.simulator import simulate
+
+        start_date = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else date.today()
+        end_date = date.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else start_date + timedelta(days=29)
+        simulate(start_date, end_date).write_jsonl(sys.stdout)
+    else:
+        today = date.today() + timedelta(days=14)
+        print(today)
+        send_slack_messages(today=today)